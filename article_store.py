@@ -0,0 +1,122 @@
+# article_store.py
+#
+# Estado intermedio de cada artículo (título, texto por bloque, referencias y citas) guardado
+# en SQLite bajo su id, para regenerar secciones sueltas sin repetir todo el pipeline.
+
+import json
+import os
+import time
+from typing import Callable, Dict, Optional
+
+from storage import SQLiteDatabase, lazy_singleton
+
+ARTICLE_STORE_PATH = os.getenv("ARTICLE_STORE_PATH", "articulos.sqlite3")
+# Segundos sin cambios tras los que un artículo ya no se puede regenerar y se borra (0 = sin límite)
+ARTICLE_TTL = float(os.getenv("ARTICLE_TTL", str(30 * 86400)))
+# Cada cuántas escrituras se borran de disco los artículos vencidos
+ARTICLE_PRUNE_EVERY = int(os.getenv("ARTICLE_PRUNE_EVERY", "200"))
+# Columnas propias de la tabla que load() añade al estado y save() no duplica en el JSON
+_METADATA = ("article_id", "created_at", "updated_at")
+
+
+class ArticleStore(SQLiteDatabase):
+    """
+    Artículos generados en SQLite (modo WAL); el estado se guarda como JSON.
+    Los que llevan más de `ttl` sin cambios no se devuelven y se borran cada `prune_every` escrituras.
+    """
+
+    def __init__(self, path: str = ARTICLE_STORE_PATH, ttl: float = ARTICLE_TTL, prune_every: int = ARTICLE_PRUNE_EVERY):
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self.writes = 0
+        super().__init__(
+            path,
+            "CREATE TABLE IF NOT EXISTS articulos ("
+            "id TEXT PRIMARY KEY, estado TEXT NOT NULL, created_at REAL, updated_at REAL)",
+            "CREATE INDEX IF NOT EXISTS articulos_updated ON articulos (updated_at)",
+        )
+        self.prune()
+
+    def oldest_valid(self) -> float:
+        # Marca de tiempo mínima de un artículo vigente (0 si no hay TTL)
+        return time.time() - self.ttl if self.ttl else 0.0
+
+    def prune(self) -> int:
+        if not self.ttl:
+            return 0
+        with self.lock:
+            deleted = self.conn.execute("DELETE FROM articulos WHERE updated_at <= ?", (self.oldest_valid(),)).rowcount
+            self.conn.commit()
+        return deleted
+
+    def save(self, article_id: str, state: Dict[str, object]):
+        now = time.time()
+        state = {k: v for k, v in state.items() if k not in _METADATA}
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO articulos (id, estado, created_at, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET estado = excluded.estado, updated_at = excluded.updated_at",
+                (article_id, json.dumps(state, ensure_ascii=False), now, now)
+            )
+            self.conn.commit()
+            self.writes += 1
+            prune = self.prune_every and self.writes % self.prune_every == 0
+        if prune:
+            self.prune()
+
+    def update(self, article_id: str, **fields):
+        # Agrega campos al estado guardado (p. ej. el id del último DOCX); no hace nada si no existe
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT estado FROM articulos WHERE id = ? AND updated_at > ?", (article_id, self.oldest_valid())
+            ).fetchone()
+            if row is None:
+                return
+            state = {**json.loads(row[0]), **fields}
+            self.conn.execute(
+                "UPDATE articulos SET estado = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(state, ensure_ascii=False), time.time(), article_id)
+            )
+            self.conn.commit()
+
+    def merge(self, article_id: str, merge_fn: Callable[[Dict[str, object]], Dict[str, object]]) -> Optional[Dict[str, object]]:
+        """
+        Lee el estado, lo combina con `merge_fn(estado)` y lo guarda en una sola transacción de
+        escritura: otra regeneración del mismo artículo (también desde otro proceso) espera su turno
+        en vez de pisar los bloques recién guardados. Devuelve el estado guardado o None si no existe.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT estado FROM articulos WHERE id = ? AND updated_at > ?", (article_id, self.oldest_valid())
+                ).fetchone()
+                if row is None:
+                    self.conn.rollback()
+                    return None
+                state = merge_fn(json.loads(row[0]))
+                state = {k: v for k, v in state.items() if k not in _METADATA}
+                self.conn.execute(
+                    "UPDATE articulos SET estado = ?, updated_at = ? WHERE id = ?",
+                    (json.dumps(state, ensure_ascii=False), time.time(), article_id)
+                )
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+        return state
+
+    def load(self, article_id: str) -> Optional[Dict[str, object]]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT estado, created_at, updated_at FROM articulos WHERE id = ? AND updated_at > ?",
+                (article_id, self.oldest_valid())
+            ).fetchone()
+        if row is None:
+            return None
+        state = json.loads(row[0])
+        state.update({"article_id": article_id, "created_at": row[1], "updated_at": row[2]})
+        return state
+
+
+get_article_store = lazy_singleton(ArticleStore)
@@ -0,0 +1,108 @@
+# artifact_store.py
+#
+# Almacén de documentos generados direccionado por contenido (sha256), con tope de tamaño
+# y expulsión LRU/TTL. El índice es SQLite para que varios workers de uvicorn lo compartan.
+
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from storage import SQLiteDatabase, lazy_singleton
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artefactos")
+# Tope total en disco y segundos sin acceso antes de borrar un artefacto
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(1024 ** 3)))
+ARTIFACT_TTL = float(os.getenv("ARTIFACT_TTL", str(7 * 86400)))
+
+
+class ArtifactStore(SQLiteDatabase):
+    """
+    Guarda cada documento una sola vez bajo el sha256 de sus bytes, en `dir/ab/abcdef...`.
+    El índice lleva tamaño, tipo y último acceso para expulsar por antigüedad y por espacio.
+    """
+
+    def __init__(self, directory: str = ARTIFACT_DIR, max_bytes: int = ARTIFACT_MAX_BYTES, ttl: float = ARTIFACT_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(
+            os.path.join(directory, "index.sqlite3"),
+            "CREATE TABLE IF NOT EXISTS artefactos ("
+            "id TEXT PRIMARY KEY, size INTEGER, media_type TEXT, filename TEXT, created_at REAL, last_access REAL)",
+            "CREATE INDEX IF NOT EXISTS artefactos_acceso ON artefactos (last_access)",
+        )
+
+    def path(self, artifact_id: str) -> str:
+        return os.path.join(self.directory, artifact_id[:2], artifact_id)
+
+    def put(self, data: bytes, media_type: str, filename: str) -> str:
+        artifact_id = hashlib.sha256(data).hexdigest()
+        path = self.path(artifact_id)
+        if not os.path.exists(path):
+            # Escritura atómica: otro worker nunca ve un archivo a medias
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO artefactos (id, size, media_type, filename, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET last_access = excluded.last_access",
+                (artifact_id, len(data), media_type, filename, now, now)
+            )
+            self.conn.commit()
+        self.evict(keep=artifact_id)
+        return artifact_id
+
+    def get(self, artifact_id: str) -> Optional[Dict[str, object]]:
+        # Devuelve los metadatos y la ruta del archivo, o None si no existe o ya se expulsó
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, media_type, filename, created_at FROM artefactos WHERE id = ?", (artifact_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE artefactos SET last_access = ? WHERE id = ?", (time.time(), artifact_id))
+            self.conn.commit()
+        path = self.path(artifact_id)
+        if not os.path.exists(path):
+            return None
+        return {"id": artifact_id, "path": path, "size": row[0], "media_type": row[1], "filename": row[2],
+                "created_at": row[3]}
+
+    def evict(self, keep: str = None):
+        # En orden de último acceso: primero lo vencido por TTL y luego lo menos usado hasta quedar bajo el tope
+        limit = time.time() - self.ttl
+        with self.lock:
+            rows = self.conn.execute("SELECT id, size, last_access FROM artefactos ORDER BY last_access").fetchall()
+            total = sum(row[1] for row in rows)
+            victims = []
+            for artifact_id, size, last_access in rows:
+                if artifact_id == keep:
+                    continue
+                if last_access < limit or total > self.max_bytes:
+                    victims.append(artifact_id)
+                    total -= size
+            if victims:
+                self.conn.executemany("DELETE FROM artefactos WHERE id = ?", [(v,) for v in victims])
+                self.conn.commit()
+        for artifact_id in victims:
+            try:
+                os.remove(self.path(artifact_id))
+            except FileNotFoundError:
+                pass
+        return victims
+
+    def get_stats(self) -> Dict[str, object]:
+        with self.lock:
+            count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artefactos").fetchone()
+        return {"artefactos": count, "bytes": total, "max_bytes": self.max_bytes, "ttl": self.ttl}
+
+
+get_artifact_store = lazy_singleton(ArtifactStore)
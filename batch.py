@@ -0,0 +1,102 @@
+# batch.py
+
+import asyncio
+import io
+import json
+import os
+import re
+import unicodedata
+import zipfile
+from typing import Callable, Dict, List, Optional
+
+from docx_writer import ZIP_DATE_TIME
+from generator import generate_article_async, prompt_dedup
+
+# Secciones en vuelo para todo el lote y máximo de artículos por solicitud
+BATCH_MAX_PARALLEL = int(os.getenv("BATCH_MAX_PARALLEL", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+
+
+def slugify(texto: str, max_len: int = 40) -> str:
+    texto = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode("ascii")
+    texto = re.sub(r"[^a-zA-Z0-9]+", "_", texto).strip("_").lower()
+    return texto[:max_len] or "articulo"
+
+
+async def generate_batch(entries: List[Dict[str, str]], max_parallel: int = BATCH_MAX_PARALLEL,
+                         on_item_done: Optional[Callable[[int, Optional[str]], None]] = None) -> List[Dict[str, object]]:
+    """
+    Genera varios artículos con un único presupuesto de concurrencia y sin repetir
+    prompts idénticos dentro del lote. Devuelve, por entrada, los bytes del DOCX o el error.
+    `on_item_done(indice, error)` se llama al terminar cada artículo (índice desde 1).
+    """
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+    # Las tareas creadas abajo heredan este diccionario compartido
+    token = prompt_dedup.set({})
+
+    async def one(index, entry):
+        try:
+            docx = await generate_article_async(entry["tema"], entry["nivel"], entry["pais"], semaphore=semaphore)
+        except Exception as e:
+            if on_item_done:
+                on_item_done(index, str(e) or type(e).__name__)
+            raise
+        if on_item_done:
+            on_item_done(index, None)
+        return docx
+
+    try:
+        outcomes = await asyncio.gather(*(one(i, e) for i, e in enumerate(entries, start=1)), return_exceptions=True)
+    finally:
+        prompt_dedup.reset(token)
+
+    results = []
+    for entry, outcome in zip(entries, outcomes):
+        if isinstance(outcome, BaseException):
+            results.append({**entry, "docx": None, "error": str(outcome) or type(outcome).__name__})
+        else:
+            results.append({**entry, "docx": outcome, "error": None})
+    return results
+
+
+def build_zip(results: List[Dict[str, object]]) -> bytes:
+    # Un DOCX por artículo correcto más manifest.json con el estado de cada entrada; fechas fijas
+    # para que el mismo lote dé el mismo ZIP en el almacén de artefactos
+    buffer = io.BytesIO()
+    manifest = []
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i, result in enumerate(results, start=1):
+            item = {"indice": i, "tema": result["tema"], "nivel": result["nivel"], "pais": result["pais"]}
+            if result["error"] is None:
+                archivo = f"{i:02d}_{slugify(result['tema'])}.docx"
+                zf.writestr(zipfile.ZipInfo(archivo, date_time=ZIP_DATE_TIME), result["docx"], zipfile.ZIP_DEFLATED)
+                item["archivo"] = archivo
+            else:
+                item["error"] = result["error"]
+            manifest.append(item)
+        zf.writestr(zipfile.ZipInfo("manifest.json", date_time=ZIP_DATE_TIME), json.dumps({
+            "total": len(results),
+            "fallidos": sum(1 for r in results if r["error"] is not None),
+            "articulos": manifest
+        }, ensure_ascii=False, indent=2), zipfile.ZIP_DEFLATED)
+    return buffer.getvalue()
+
+
+def validate_entries(entradas) -> List[Dict[str, str]]:
+    """
+    Normaliza las entradas del lote con los valores por defecto de /generar.
+    Lanza ValueError con un mensaje para el cliente si alguna no es válida.
+    """
+    if not isinstance(entradas, list) or not 1 <= len(entradas) <= BATCH_MAX_ITEMS:
+        raise ValueError(f"El lote debe tener entre 1 y {BATCH_MAX_ITEMS} artículos")
+    entries = []
+    for i, e in enumerate(entradas, start=1):
+        if not isinstance(e, dict):
+            raise ValueError(f"La entrada {i} debe ser un objeto con 'tema', 'nivel' y 'pais'")
+        entry = {"tema": e.get("tema"), "nivel": e.get("nivel", "Scopus"), "pais": e.get("pais", "Perú")}
+        if not isinstance(entry["tema"], str) or not entry["tema"].strip():
+            raise ValueError(f"La entrada {i} no tiene 'tema'")
+        if not isinstance(entry["nivel"], str) or not isinstance(entry["pais"], str):
+            raise ValueError(f"En la entrada {i}, 'nivel' y 'pais' deben ser texto")
+        entries.append(entry)
+    return entries
@@ -0,0 +1,95 @@
+# bench/bench_citations.py
+#
+# Microbenchmark de la inserción de citas sobre documentos grandes.
+# Uso (desde la raíz del repo):
+#
+#     python -m bench.bench_citations --oraciones 20000 --repeticiones 5
+
+import argparse
+import random
+import time
+
+from citation_generator import CitationGenerator
+from generator_utils import generate_references, generate_textual_citations, insert_citations_into_text
+
+PALABRAS = (
+    "los compuestos bioactivos presentes en Rubus spp. contribuyen a mejorar el perfil lipídico "
+    "según Smith, J. y García et al. en estudios recientes sobre la calidad del agua y la salud"
+).split()
+
+
+def build_text(n_sentences: int, seed: int = 7) -> str:
+    rng = random.Random(seed)
+    sentences = []
+    for _ in range(n_sentences):
+        words = [rng.choice(PALABRAS) for _ in range(rng.randint(8, 20))]
+        sentences.append(" ".join(words).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def legacy_insert(text: str, citations: list) -> str:
+    # Implementación anterior (split(". ") y uniones repetidas), solo como referencia
+    sentences = text.split(". ")
+    result = []
+    used = set()
+    current_para = []
+    for i, sentence in enumerate(sentences):
+        if not sentence.strip():
+            continue
+        citation = citations[i % len(citations)]
+        if citation in used:
+            result.append(". ".join(current_para) + ".")
+            current_para = [f"{sentence.strip()} {citation}"]
+            used = {citation}
+        else:
+            current_para.append(f"{sentence.strip()} {citation}")
+            used.add(citation)
+    if current_para:
+        result.append(". ".join(current_para) + ".")
+    return "\n\n".join(result)
+
+
+def best_of(fn, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmark de inserción de citas")
+    parser.add_argument("--oraciones", type=int, default=10000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    text = build_text(args.oraciones)
+    citations = generate_textual_citations(generate_references("calidad del agua"))
+
+    legacy = best_of(lambda: legacy_insert(text, citations), args.repeticiones)
+    engine = best_of(lambda: insert_citations_into_text(text, citations), args.repeticiones)
+
+    # Artículo completo: 13 bloques, cada uno con una parte del documento
+    blocks = ["contexto", "mundial", "latam", "peru", "problema", "justificacion", "teoria1", "teoria2",
+              "concepto1_p1", "concepto1_p2", "concepto2_p1", "concepto2_p2", "concepto2_p3"]
+    per_block = max(1, args.oraciones // len(blocks))
+    generated_text = {b: build_text(per_block, seed=i) for i, b in enumerate(blocks)}
+
+    def full_pipeline():
+        cg = CitationGenerator(title="Calidad del agua en cuencas andinas", generated_text=generated_text)
+        cg.generate_all_references()
+        cg.generate_all_citations()
+        cg.insert_all_citations()
+        cg.get_references_list()
+
+    pipeline = best_of(full_pipeline, args.repeticiones)
+
+    print(f"oraciones: {args.oraciones}")
+    print(f"legacy split('. '):       {legacy * 1000:8.2f} ms")
+    print(f"motor actual:             {engine * 1000:8.2f} ms  ({args.oraciones / engine:,.0f} oraciones/s)")
+    print(f"CitationGenerator (13 b): {pipeline * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
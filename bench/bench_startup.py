@@ -0,0 +1,62 @@
+# bench/bench_startup.py
+#
+# Mide cuánto tarda `import main` en un proceso nuevo y comprueba que el arranque no
+# importa openai ni python-docx. Sale con código 1 si se supera el límite, para usarlo en CI:
+#
+#     python -m bench.bench_startup --repeticiones 5 --max-segundos 1.5
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos pesados que solo deben cargarse en el primer uso
+LAZY_MODULES = ("openai", "docx", "aiohttp")
+
+PROBE = (
+    "import json, sys, time\n"
+    "start = time.perf_counter()\n"
+    "import main\n"
+    "elapsed = time.perf_counter() - start\n"
+    f"print(json.dumps({{'segundos': elapsed, 'cargados': [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))\n"
+)
+
+
+def measure_once() -> dict:
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, PYTHONDONTWRITEBYTECODE="1")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo de importación de la API")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--max-segundos", type=float, default=None, help="Falla si la mediana supera este valor")
+    args = parser.parse_args(argv)
+
+    runs = [measure_once() for _ in range(args.repeticiones)]
+    times = [r["segundos"] for r in runs]
+    loaded = sorted({m for r in runs for m in r["cargados"]})
+    median = statistics.median(times)
+
+    print(f"import main: mediana {median * 1000:.0f} ms  mínimo {min(times) * 1000:.0f} ms  ({len(times)} corridas)")
+    print(f"módulos pesados cargados al importar: {loaded or 'ninguno'}")
+
+    failed = False
+    if loaded:
+        print("ERROR: el arranque importa módulos que deberían cargarse en el primer uso")
+        failed = True
+    if args.max_segundos is not None and median > args.max_segundos:
+        print(f"ERROR: la importación supera {args.max_segundos} s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
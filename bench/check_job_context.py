@@ -0,0 +1,103 @@
+# bench/check_job_context.py
+#
+# Comprueba que el estado por trabajo (receptor de tokens, política de caché...) no se filtra al
+# siguiente trabajo del mismo worker: con un solo trabajador lanza un artículo en streaming y
+# luego uno normal, que no debe pedir nada en streaming ni emitir eventos en el trabajo anterior.
+# Sale con código 1 si falla, para usarlo en CI:
+#
+#     python -m bench.check_job_context
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+import aiohttp
+
+from bench.run_benchmark import REPO_ROOT, start_process, wait_ready
+
+
+async def stream_article(session, base, tema):
+    # Sigue /generar/stream hasta el evento final y devuelve (job_id, eventos recibidos)
+    job_id, events, event = None, [], None
+    async with session.post(f"{base}/generar/stream", json={"tema": tema, "cache": "bypass"}) as response:
+        async for raw in response.content:
+            line = raw.decode("utf-8").strip()
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "job":
+                    job_id = data["job_id"]
+                events.append(event)
+                if event in ("done", "error"):
+                    break
+    return job_id, events
+
+
+async def plain_article(session, base, tema):
+    async with session.post(f"{base}/generar", json={"tema": tema, "cache": "bypass"}) as response:
+        job_id = (await response.json())["job_id"]
+    while True:
+        await asyncio.sleep(0.2)
+        async with session.get(f"{base}/generar/{job_id}") as response:
+            status = await response.json()
+        if status["status"] in ("completado", "error"):
+            return status
+
+
+async def check(args):
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_BASE": f"http://127.0.0.1:{args.puerto_fake}/v1",
+        "OPENAI_API_KEY": "fake",
+        "LLM_CACHE_MODE": "off",
+        "JOB_WORKERS": "1",
+        "PYTHONPATH": REPO_ROOT,
+    })
+    fake = start_process([sys.executable, "-m", "bench.fake_openai", "--puerto", str(args.puerto_fake),
+                          "--mediana", "0.02", "--sigma", "0"], env)
+    api = start_process([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                         "--port", str(args.puerto_api), "--log-level", "warning"], env)
+    base = f"http://127.0.0.1:{args.puerto_api}"
+    stats_url = f"http://127.0.0.1:{args.puerto_fake}/stats"
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_ready(session, stats_url)
+            await wait_ready(session, f"{base}/health/ready")
+
+            _, events = await stream_article(session, base, "primer tema en streaming")
+            if events[-1] != "done" or "token" not in events:
+                print(f"FALLO: el artículo en streaming no terminó bien: {events[-3:]}")
+                return 1
+            async with session.get(stats_url) as response:
+                before = (await response.json())["stream"]
+
+            status = await plain_article(session, base, "segundo tema sin streaming")
+            async with session.get(stats_url) as response:
+                after = (await response.json())["stream"]
+    finally:
+        api.terminate()
+        fake.terminate()
+
+    if status["status"] != "completado":
+        print(f"FALLO: el artículo normal terminó en {status['status']}: {status['error']}")
+        return 1
+    if after != before:
+        print(f"FALLO: el artículo normal hizo {after - before} llamadas en streaming (receptor del trabajo anterior)")
+        return 1
+    print("ok: el segundo trabajo del worker no hereda el streaming del primero")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aislamiento del contexto entre trabajos de un mismo worker")
+    parser.add_argument("--puerto-fake", type=int, default=8775)
+    parser.add_argument("--puerto-api", type=int, default=8812)
+    args = parser.parse_args(argv)
+    sys.exit(asyncio.run(check(args)))
+
+
+if __name__ == "__main__":
+    main()
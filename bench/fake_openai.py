@@ -0,0 +1,139 @@
+# bench/fake_openai.py
+#
+# Servidor local compatible con /v1/chat/completions para medir el pipeline sin gastar cuota.
+# Simula latencia (log-normal), errores 429/5xx y respuestas con la forma de cada sección.
+#
+#     python -m bench.fake_openai --puerto 8765 --mediana 1.5 --sigma 0.4 --tasa-429 0.05
+#
+# Luego basta con OPENAI_API_BASE=http://127.0.0.1:8765/v1 al arrancar la API.
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+
+from aiohttp import web
+
+PARRAFO = (
+    "En consonancia con lo anterior, los sistemas de gestión presentan desafíos persistentes en la región. "
+    "Diversos estudios describen una brecha entre la capacidad instalada y la demanda efectiva de servicios. "
+    "Asimismo, las instituciones enfrentan limitaciones presupuestarias que afectan la continuidad de los programas. "
+    "Por otro lado, la adopción de herramientas digitales avanza de manera desigual entre territorios. "
+    "En ese sentido, la evidencia reciente respalda la necesidad de intervenciones sostenidas y medibles."
+)
+
+
+def canned_response(prompt: str) -> str:
+    # Devuelve un texto con la misma estructura que espera generator.SECTION_PARTS
+    if "objeto JSON" in prompt:
+        # Modo estructurado: un párrafo por cada clave pedida en las instrucciones JSON
+        keys = re.findall(r'"(\w+)" \(', prompt.rsplit("objeto JSON", 1)[1])
+        return json.dumps({k: PARRAFO for k in keys}, ensure_ascii=False)
+    if "título académico formal" in prompt:
+        return "Gestión hídrica sostenible y resiliencia comunitaria en cuencas andinas"
+    if "3 párrafos" in prompt:
+        return "\n".join(f"{nivel} {PARRAFO}" for nivel in ("A nivel global,", "En Latinoamérica,", "En el contexto nacional,"))
+    if "2 teorías" in prompt:
+        return "\n\n".join([PARRAFO, PARRAFO])
+    if "4 PARRAFOS" in prompt:
+        return "\n\n".join([PARRAFO] * 5)
+    return PARRAFO
+
+
+class FakeOpenAI:
+    def __init__(self, median: float = 1.0, sigma: float = 0.3, rate_429: float = 0.0,
+                 rate_5xx: float = 0.0, seed: int = None):
+        self.median = median
+        self.sigma = sigma
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "429": 0, "5xx": 0, "ok": 0, "stream": 0}
+
+    def latency(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        return self.rng.lognormvariate(0, self.sigma) * self.median
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        self.stats["requests"] += 1
+
+        await asyncio.sleep(self.latency())
+
+        roll = self.rng.random()
+        if roll < self.rate_429:
+            self.stats["429"] += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached (simulado)", "type": "requests", "code": "rate_limit_exceeded"}},
+                status=429, headers={"Retry-After": "1"}
+            )
+        if roll < self.rate_429 + self.rate_5xx:
+            self.stats["5xx"] += 1
+            return web.json_response({"error": {"message": "Error interno (simulado)", "type": "server_error"}}, status=500)
+
+        self.stats["ok"] += 1
+        content = canned_response(prompt)
+        # Como la API real: la respuesta se corta en max_tokens (~4 caracteres por token)
+        finish_reason = "stop"
+        max_tokens = body.get("max_tokens")
+        if max_tokens and len(content) > max_tokens * 4:
+            content, finish_reason = content[:max_tokens * 4], "length"
+        completion_tokens = len(content) // 4
+        prompt_tokens = len(prompt) // 4
+        created = int(time.time())
+
+        if body.get("stream"):
+            self.stats["stream"] += 1
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            for word in content.split(" "):
+                chunk = {"id": "fake", "object": "chat.completion.chunk", "created": created, "model": body.get("model"),
+                         "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+                await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            # Como la API real, el último fragmento llega sin texto y con finish_reason
+            chunk = {"id": "fake", "object": "chat.completion.chunk", "created": created, "model": body.get("model"),
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await response.write(b"data: [DONE]\n\n")
+            return response
+
+        return web.json_response({
+            "id": "fake",
+            "object": "chat.completion",
+            "created": created,
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat)
+        app.router.add_get("/stats", self.get_stats)
+        return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor OpenAI simulado para benchmarks")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--mediana", type=float, default=1.0, help="Latencia mediana por llamada (s)")
+    parser.add_argument("--sigma", type=float, default=0.3, help="Dispersión log-normal de la latencia")
+    parser.add_argument("--tasa-429", type=float, default=0.0)
+    parser.add_argument("--tasa-5xx", type=float, default=0.0)
+    parser.add_argument("--semilla", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    fake = FakeOpenAI(args.mediana, args.sigma, args.tasa_429, args.tasa_5xx, args.semilla)
+    web.run_app(fake.app(), host="127.0.0.1", port=args.puerto, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+# bench/run_benchmark.py
+#
+# Benchmark de punta a punta sin coste: levanta bench.fake_openai y la API (uvicorn) en local,
+# lanza artículos contra /generar con la concurrencia indicada y guarda los resultados en JSON.
+#
+#     python -m bench.run_benchmark --articulos 40 --concurrencia 8 --mediana 1.0 --salida bench.json
+#     python -m bench.run_benchmark ... --comparar bench.json   # muestra la diferencia con otra corrida
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+from bench.fake_openai import canned_response
+from citation_generator import CitationGenerator
+from docx_writer import render_article_docx
+from generator import SECTION_PARTS, build_article, split_sections
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(values):
+    if not values:
+        return {"n": 0}
+    return {
+        "n": len(values),
+        "media": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+
+def start_process(args, env):
+    return subprocess.Popen(args, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+async def wait_ready(session, url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url) as response:
+                if response.status < 500:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió en {timeout} s")
+
+
+async def run_article(session, base, index, poll, mode):
+    record = {"indice": index, "estado": None}
+    start = time.perf_counter()
+    body = {"tema": f"tema de prueba {index}", "cache": "bypass", "modo": mode}
+    # Cada artículo simula un cliente distinto para que la cuota por cliente no limite la prueba
+    headers = {"X-Forwarded-For": f"10.0.{index // 256 % 256}.{index % 256}"}
+    async with session.post(f"{base}/generar", json=body, headers=headers) as response:
+        data = await response.json()
+        if response.status != 202:
+            record["estado"] = f"rechazado_{response.status}"
+            record["total"] = time.perf_counter() - start
+            return record
+    job_id = data["job_id"]
+
+    while True:
+        await asyncio.sleep(poll)
+        async with session.get(f"{base}/generar/{job_id}") as response:
+            status = await response.json()
+        if status["status"] in ("completado", "error"):
+            break
+
+    record["estado"] = status["status"]
+    record["espera_cola"] = status["started_at"] - status["created_at"]
+    record["generacion"] = status["finished_at"] - status["started_at"]
+    if status["status"] == "completado":
+        download_start = time.perf_counter()
+        async with session.get(f"{base}/generar/{job_id}/descargar") as response:
+            record["bytes"] = len(await response.read())
+        record["descarga"] = time.perf_counter() - download_start
+    else:
+        record["error"] = status.get("error")
+    record["total"] = time.perf_counter() - start
+    return record
+
+
+def offline_stages(repeats):
+    # Mide en proceso las etapas que no dependen del LLM con texto de forma realista
+    results = {"titulo": canned_response("título académico formal")}
+    for name in SECTION_PARTS:
+        if name != "titulo":
+            prompt = {"mundial_latam_peru": "3 párrafos", "teorias": "2 teorías", "conceptos": "4 PARRAFOS"}.get(name, "")
+            results[name] = canned_response(prompt)
+
+    generated_text = split_sections(results)
+    citas, docx, articulo = [], [], []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        cg = CitationGenerator(title=results["titulo"], generated_text=generated_text)
+        cg.generate_all_references()
+        cg.generate_all_citations()
+        text = cg.insert_all_citations()
+        cg.get_references_list()
+        t1 = time.perf_counter()
+        render_article_docx("\n\n".join(text.values()))
+        t2 = time.perf_counter()
+        build_article(results)
+        t3 = time.perf_counter()
+        citas.append(t1 - t0)
+        docx.append(t2 - t1)
+        articulo.append(t3 - t2)
+    return {"citas": summarize(citas), "docx": summarize(docx), "build_article": summarize(articulo)}
+
+
+async def drive(args):
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_BASE": f"http://127.0.0.1:{args.puerto_fake}/v1",
+        "OPENAI_API_KEY": "fake",
+        "LLM_CACHE_MODE": "off",
+        "LLM_RPM": str(args.rpm),
+        "LLM_TPM": str(args.tpm),
+        # El benchmark hace de proxy de confianza: cada artículo llega con su propio X-Forwarded-For
+        "TRUSTED_PROXY_HOPS": "1",
+        "PYTHONPATH": REPO_ROOT,
+    })
+    fake = start_process([
+        sys.executable, "-m", "bench.fake_openai", "--puerto", str(args.puerto_fake),
+        "--mediana", str(args.mediana), "--sigma", str(args.sigma),
+        "--tasa-429", str(args.tasa_429), "--tasa-5xx", str(args.tasa_5xx), "--semilla", str(args.semilla),
+    ], env)
+    api = start_process([
+        sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+        "--port", str(args.puerto_api), "--log-level", "warning",
+    ], env)
+    base = f"http://127.0.0.1:{args.puerto_api}"
+
+    try:
+        timeout = aiohttp.ClientTimeout(total=None)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            await wait_ready(session, f"http://127.0.0.1:{args.puerto_fake}/stats")
+            await wait_ready(session, f"{base}/health/ready", timeout=args.espera_arranque)
+
+            semaphore = asyncio.Semaphore(args.concurrencia)
+
+            async def limited(i):
+                async with semaphore:
+                    return await run_article(session, base, i, args.sondeo, args.modo)
+
+            start = time.perf_counter()
+            records = await asyncio.gather(*(limited(i) for i in range(args.articulos)))
+            wall = time.perf_counter() - start
+
+            async with session.get(f"http://127.0.0.1:{args.puerto_fake}/stats") as response:
+                fake_stats = await response.json()
+    finally:
+        for process in (api, fake):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    completed = [r for r in records if r["estado"] == "completado"]
+    return {
+        "config": vars(args),
+        "entorno": {"python": platform.python_version(), "plataforma": platform.platform()},
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "duracion_s": wall,
+        "articulos_por_minuto": len(completed) / wall * 60 if wall else 0,
+        "estados": {e: sum(1 for r in records if r["estado"] == e) for e in {r["estado"] for r in records}},
+        "latencia_total": summarize([r["total"] for r in completed]),
+        "etapas": {
+            "espera_cola": summarize([r["espera_cola"] for r in completed]),
+            "generacion": summarize([r["generacion"] for r in completed]),
+            "descarga": summarize([r["descarga"] for r in completed]),
+        },
+        "etapas_offline": offline_stages(args.repeticiones_offline),
+        "fake_openai": fake_stats,
+        "articulos": records,
+    }
+
+
+def print_report(report, previous=None):
+    def fmt(value):
+        return "-" if value is None else f"{value:8.3f}"
+
+    def delta(path):
+        if previous is None:
+            return ""
+        old, new = previous, report
+        for key in path:
+            old = (old or {}).get(key)
+            new = (new or {}).get(key)
+        if not old or new is None:
+            return ""
+        return f"  ({(new - old) / old * 100:+.1f}%)"
+
+    total = report["latencia_total"]
+    print(f"artículos completados: {total['n']}  estados: {report['estados']}")
+    print(f"artículos/min:         {report['articulos_por_minuto']:8.2f}{delta(['articulos_por_minuto'])}")
+    for p in ("p50", "p95", "p99"):
+        print(f"latencia {p}:          {fmt(total.get(p))} s{delta(['latencia_total', p])}")
+    for group in ("etapas", "etapas_offline"):
+        for stage, stats in report[group].items():
+            print(f"  {stage:<20} p50 {fmt(stats.get('p50'))} s  p95 {fmt(stats.get('p95'))} s{delta([group, stage, 'p50'])}")
+    print(f"fake_openai: {report['fake_openai']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de /generar contra un OpenAI simulado")
+    parser.add_argument("--articulos", type=int, default=20)
+    parser.add_argument("--concurrencia", type=int, default=5)
+    parser.add_argument("--mediana", type=float, default=1.0, help="Latencia mediana por llamada al LLM (s)")
+    parser.add_argument("--sigma", type=float, default=0.3)
+    parser.add_argument("--tasa-429", type=float, default=0.0)
+    parser.add_argument("--tasa-5xx", type=float, default=0.0)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--rpm", type=float, default=10000, help="Cuota simulada de solicitudes por minuto")
+    parser.add_argument("--tpm", type=float, default=2000000, help="Cuota simulada de tokens por minuto")
+    parser.add_argument("--modo", choices=("texto", "json"), default="texto", help="Modo de generación de la API")
+    parser.add_argument("--sondeo", type=float, default=0.2, help="Intervalo de consulta del estado (s)")
+    parser.add_argument("--puerto-fake", type=int, default=8765)
+    parser.add_argument("--puerto-api", type=int, default=8800)
+    parser.add_argument("--espera-arranque", type=float, default=120)
+    parser.add_argument("--repeticiones-offline", type=int, default=20)
+    parser.add_argument("--salida", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior para comparar")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(drive(args))
+
+    previous = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            previous = json.load(f)
+    print_report(report, previous)
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"resultados guardados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
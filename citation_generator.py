@@ -1,69 +1,154 @@
 # citation_generator.py
 
-import re
+import bisect
 from typing import List, Dict
-from generator_utils import generate_apa_references, generate_textual_citations, insert_citations_into_text
+import re
+from reference_index import key_terms, search_terms
+from generator_utils import Reference, generate_references, generate_textual_citations, insert_citations, split_sentences
+
+# Términos con los que se busca cada teoría y cada variable
+LABEL_TERMS = 5
+# Oración que nombra la teoría: el prompt de teorías deja la primera para un preámbulo
+_THEORY_RE = re.compile(r"\b(?:teor[ií]as?|modelos?|enfoques?|paradigmas?)\b", re.IGNORECASE)
+# Nombre propio (autor o nombre de la teoría) que no abre la oración
+_PROPER_RE = re.compile(r"(?<=\s)[A-ZÁÉÍÓÚÑ][a-záéíóúñ]{2,}")
+
+class Bibliography:
+    # Lista de referencias ordenada y sin duplicados que se mantiene al ir agregando
+    def __init__(self):
+        self.seen = set()
+        self.refs: List[Reference] = []
+
+    def add(self, ref: Reference):
+        if ref.apa not in self.seen:
+            self.seen.add(ref.apa)
+            bisect.insort(self.refs, ref)
+
+    def extend(self, refs):
+        for ref in refs:
+            self.add(ref)
+
+    def as_list(self) -> List[str]:
+        return [ref.apa for ref in self.refs]
 
 class CitationGenerator:
-    def __init__(self, title: str, generated_text: Dict[str, str]):
+    def __init__(self, title: str, generated_text: Dict[str, str], country: str = "Perú"):
         self.title = title
+        self.country = country or "Perú"
         self.generated_text = generated_text  # Diccionario con claves como 'contexto', 'mundial', 'latam', 'peru', 'teoria1', etc.
         self.index = self._create_index()
         self.references_by_block = {}
         self.citations_by_block = {}
+        self.bibliography = Bibliography()
 
     def _create_index(self) -> Dict[str, str]:
         # Genera el índice auxiliar en base al título y al texto ya generado
         theme = self.title.lower()
         return {
-            "problematica mundial": f"problematica {theme} mundial",
-            "problematica latam": f"problematica {theme} latam",
-            "problematica peru": f"problematica {theme} peru",
-            "1 teoria": self.generated_text.get("teoria1_title", "1 teoria"),
-            "2 teoria": self.generated_text.get("teoria2_title", "2 teoria"),
-            "1 variable": self.generated_text.get("variable1_title", "1 variable"),
-            "2 variable": self.generated_text.get("variable2_title", "2 variable"),
+            "problematica mundial": f"problematica {theme} mundial global",
+            "problematica latam": f"problematica {theme} latinoamérica américa latina",
+            "problematica peru": f"problematica {theme} {self.country.lower()}",
+            "1 teoria": self._theory_label(theme, "teoria1"),
+            "2 teoria": self._theory_label(theme, "teoria2"),
+            "1 variable": self._variable_label(theme, "concepto1"),
+            "2 variable": self._variable_label(theme, "concepto2"),
         }
 
+    def _theory_label(self, theme: str, block: str) -> str:
+        # Nombre de la teoría y sus autores: la oración que la nombra, desde la palabra "teoría" hasta
+        # la primera coma, más los nombres propios de esa oración
+        sentences = [s for s in re.split(r"(?<=\.)\s+", (self.generated_text.get(block) or "").strip()) if s]
+        naming = next((s for s in sentences if _THEORY_RE.search(s)), sentences[1] if len(sentences) > 1 else "")
+        match = _THEORY_RE.search(naming)
+        name = re.split(r"[,.;:(]", naming[match.start():])[0] if match else ""
+        terms = search_terms(f"{name} {' '.join(_PROPER_RE.findall(naming))}")
+        return " ".join(terms[:LABEL_TERMS]) or theme
+
+    def _variable_label(self, theme: str, prefix: str) -> str:
+        # Los párrafos de cada variable abren con un conector: se usan los términos que más repiten
+        text = " ".join(v for k, v in self.generated_text.items() if k.startswith(prefix) and v)
+        return " ".join(key_terms(text, LABEL_TERMS)) or theme
+
+    @staticmethod
+    def _index_key(block: str):
+        # Qué bloque del índice aporta las citas de cada sección del texto
+        if block == "contexto":
+            return "problematica mundial"
+        if block in ("mundial", "latam", "peru"):
+            return f"problematica {block}"
+        if block.startswith("teoria"):
+            return f"{block[-1]} teoria"
+        if block.startswith("concepto1"):
+            return "1 variable"
+        if block.startswith("concepto2"):
+            return "2 variable"
+        return None
+
+    @staticmethod
+    def _source_type(key: str) -> str:
+        return "institucional" if "problematica" in key else "cientifico"
+
     def generate_all_references(self):
         # Búsqueda automática de fuentes y generación de referencias APA
         for key, label in self.index.items():
-            if "problematica" in key:
-                self.references_by_block[key] = generate_apa_references(label, source_type="institucional")
-            else:
-                self.references_by_block[key] = generate_apa_references(label, source_type="cientifico")
+            refs = generate_references(label, source_type=self._source_type(key))
+            self.references_by_block[key] = refs
+            self.bibliography.extend(refs)
+
+    def replace_blocks(self, updated: Dict[str, str]) -> List[str]:
+        """
+        Sustituye bloques regenerados. Si con ellos cambia la etiqueta de una teoría o variable
+        (otra teoría, otros términos), vuelve a buscar sus referencias y citas y rehace la
+        bibliografía. Devuelve las claves del índice renovadas.
+        """
+        self.generated_text = {**self.generated_text, **updated}
+        index = self._create_index()
+        refreshed = [key for key, label in index.items() if self.index.get(key) != label]
+        self.index = index
+        for key in refreshed:
+            self.references_by_block[key] = generate_references(index[key], source_type=self._source_type(key))
+            self.citations_by_block[key] = generate_textual_citations(self.references_by_block[key])
+        if refreshed:
+            self.bibliography = Bibliography()
+            for refs in self.references_by_block.values():
+                self.bibliography.extend(refs)
+        return refreshed
 
     def generate_all_citations(self):
         # Genera las citas en formato textual (narrativas y parentéticas)
         for key, refs in self.references_by_block.items():
             self.citations_by_block[key] = generate_textual_citations(refs)
 
+    def insert_block_citations(self, block: str) -> str:
+        # Inserta las citas en un solo bloque (para regenerar secciones sueltas)
+        text = self.generated_text[block]
+        citations = self.citations_by_block.get(self._index_key(block))
+        if citations:
+            return insert_citations(split_sentences(text), citations)
+        return text
+
     def insert_all_citations(self) -> Dict[str, str]:
-        # Inserta las citas en el texto generado, cumpliendo reglas de alternancia y estructura
-        final_text = {}
-        for block, text in self.generated_text.items():
-            if block == "contexto":
-                citations = self.citations_by_block.get("problematica mundial", [])
-            elif block in ["mundial", "latam", "peru"]:
-                key = f"problematica {block}"
-                citations = self.citations_by_block.get(key, [])
-            elif block.startswith("teoria"):
-                key = f"{block[-1]} teoria"
-                citations = self.citations_by_block.get(key, [])
-            elif block.startswith("concepto1"):
-                citations = self.citations_by_block.get("1 variable", [])
-            elif block.startswith("concepto2"):
-                citations = self.citations_by_block.get("2 variable", [])
-            else:
-                citations = []
-
-            final_text[block] = insert_citations_into_text(text, citations)
-
-        return final_text
+        # Inserta las citas en todos los bloques en una sola pasada, cumpliendo reglas de alternancia y estructura
+        return {block: self.insert_block_citations(block) for block in self.generated_text}
 
     def get_references_list(self) -> List[str]:
-        # Devuelve todas las referencias en formato APA ordenadas
-        all_refs = []
-        for block in self.references_by_block.values():
-            all_refs.extend(block)
-        return sorted(list(set(all_refs)))
+        # Devuelve todas las referencias en formato APA ordenadas (ya deduplicadas al agregarlas)
+        return self.bibliography.as_list()
+
+    def to_state(self) -> Dict[str, object]:
+        # Referencias y citas por bloque en forma serializable a JSON
+        return {
+            "references_by_block": {k: [r.to_dict() for r in refs] for k, refs in self.references_by_block.items()},
+            "citations_by_block": dict(self.citations_by_block),
+        }
+
+    @classmethod
+    def from_state(cls, title: str, generated_text: Dict[str, str], state: Dict[str, object]) -> "CitationGenerator":
+        # Reconstruye el generador sin volver a buscar referencias ni generar citas
+        cg = cls(title=title, generated_text=generated_text, country=state.get("pais"))
+        for key, records in state["references_by_block"].items():
+            refs = [Reference.from_record(r) for r in records]
+            cg.references_by_block[key] = refs
+            cg.bibliography.extend(refs)
+        cg.citations_by_block = dict(state["citations_by_block"])
+        return cg
@@ -1,15 +1,64 @@
-from docx import Document
+import io
+import os
+import threading
+import zipfile
 
-def save_article_to_docx(texto, ruta_archivo):
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+# Plantilla .docx opcional con estilos propios; si no existe se usa la de python-docx
+DOCX_TEMPLATE = os.getenv("DOCX_TEMPLATE")
+# Fecha fija de las entradas del ZIP: el mismo texto produce siempre los mismos bytes (y el mismo hash)
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+_template_bytes = None
+_template_lock = threading.Lock()
+
+def load_template():
+    # Prepara una sola vez la plantilla base (estilos + encabezado) y la guarda en memoria
+    global _template_bytes
+    if _template_bytes is None:
+        with _template_lock:
+            if _template_bytes is None:
+                # python-docx se importa aquí, en el primer uso, y no al arrancar la API
+                from docx import Document
+                doc = Document(DOCX_TEMPLATE) if DOCX_TEMPLATE else Document()
+                doc.add_heading("Artículo científico", 0)
+                buffer = io.BytesIO()
+                doc.save(buffer)
+                _template_bytes = buffer.getvalue()
+    return _template_bytes
+
+def _normalize_zip(data):
+    # python-docx escribe la hora actual en cada entrada del ZIP; se reescribe con la fecha fija
+    out = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(data)) as src, zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            entry = zipfile.ZipInfo(info.filename, date_time=ZIP_DATE_TIME)
+            entry.compress_type = zipfile.ZIP_DEFLATED
+            entry.external_attr = info.external_attr
+            dst.writestr(entry, src.read(info.filename))
+    return out.getvalue()
+
+def render_article_docx(texto):
+    # Genera el DOCX en memoria y devuelve sus bytes, sin pasar por disco
     try:
-        doc = Document()
-        doc.add_heading("Artículo científico", 0)
+        from docx import Document
+        doc = Document(io.BytesIO(load_template()))
 
         for linea in texto.split("\n"):
             if linea.strip():
                 doc.add_paragraph(linea.strip())
 
-        doc.save(ruta_archivo)
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        return _normalize_zip(buffer.getvalue())
+    except Exception as e:
+        print("❌ Error al generar el DOCX:", str(e))
+        raise e
+
+def save_article_to_docx(texto, ruta_archivo):
+    try:
+        with open(ruta_archivo, "wb") as f:
+            f.write(render_article_docx(texto))
     except Exception as e:
         print("❌ Error al guardar el DOCX:", str(e))
         raise e
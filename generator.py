@@ -1,138 +1,313 @@
-import openai
+import asyncio
+import contextvars
 import os
-import time
-from docx import Document
-from docx_writer import save_article_to_docx
-from datetime import datetime
+import weakref
+from article_store import get_article_store
+from citation_generator import CitationGenerator
+from docx_writer import render_article_docx
+from llm_cache import cache_policy
+from llm_client import LLM_TRUNCATION_GROWTH, LLMTruncatedError, get_client
+from metrics import COALESCED, LLM_CALL_SECONDS, current_section, record_request, span
+from prompts import max_tokens_for, render_prompt
+from section_graph import Section, SectionError, run_sections
+from structured import Field, generate_structured, repair_field
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# "texto": una llamada por sección y división por saltos de línea
+# "json": pocas llamadas que devuelven JSON con campos nombrados, validado contra un esquema
+GENERATION_MODES = ("texto", "json")
+GENERATION_MODE = os.getenv("GENERATION_MODE", "texto")
 
-def gpt(prompt):
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.65,
-            max_tokens=2000
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        return f"Error al generar contenido: {str(e)}"
+# Si hay un receptor, cada sección se pide en streaming y se le envían los fragmentos: sink(seccion, texto).
+# sink(seccion, None) indica que lo enviado de esa sección se descarta (se vuelve a pedir con más tokens)
+token_sink = contextvars.ContextVar("token_sink", default=None)
+# En un lote, prompts idénticos comparten una sola llamada: {prompt: tarea}
+prompt_dedup = contextvars.ContextVar("prompt_dedup", default=None)
+
+# Llamadas en vuelo por event loop: {loop: {prompt: tarea}} (single-flight entre solicitudes concurrentes)
+_inflight_prompts = weakref.WeakKeyDictionary()
+
+async def agpt(prompt, section=None, max_tokens=None, allow_truncated=False):
+    # Sin max_tokens explícito se usa el presupuesto de la plantilla de la sección
+    max_tokens = max_tokens or max_tokens_for(section)
+    dedup = prompt_dedup.get()
+    if dedup is not None:
+        task = dedup.get(prompt)
+        if task is None:
+            task = dedup[prompt] = asyncio.ensure_future(_agpt(prompt, section, max_tokens, allow_truncated))
+        return await asyncio.shield(task)
+
+    # Quien hace streaming o pide ignorar la caché necesita su propia llamada
+    if token_sink.get() is not None or cache_policy.get() is not None:
+        return await _agpt(prompt, section, max_tokens, allow_truncated)
+
+    inflight = _inflight_prompts.setdefault(asyncio.get_running_loop(), {})
+    task = inflight.get(prompt)
+    if task is None:
+        task = inflight[prompt] = asyncio.ensure_future(_agpt(prompt, section, max_tokens, allow_truncated))
+        task.add_done_callback(lambda t: inflight.pop(prompt, None) if inflight.get(prompt) is t else None)
+    else:
+        COALESCED.inc(capa="prompt")
+    return await asyncio.shield(task)
+
+async def _agpt(prompt, section, max_tokens, allow_truncated=False):
+    current_section.set(section)
+    with span("llm", LLM_CALL_SECONDS, seccion=section or "otro"):
+        return await _agpt_call(prompt, section, max_tokens, allow_truncated)
+
+async def _stream_call(prompt, section, sink, max_tokens, allow_truncated):
+    parts = []
+    async for delta in get_client().chat_stream(prompt, temperature=0.65, max_tokens=max_tokens,
+                                                allow_truncated=allow_truncated):
+        parts.append(delta)
+        sink(section, delta)
+    return "".join(parts).strip()
+
+async def _agpt_call(prompt, section, max_tokens, allow_truncated=False):
+    # Los errores (ya reintentados por el cliente) se propagan: nunca se devuelven como texto
+    sink = token_sink.get()
+    if sink is None or section is None:
+        content = await get_client().chat(prompt, temperature=0.65, max_tokens=max_tokens,
+                                          allow_truncated=allow_truncated)
+    else:
+        try:
+            content = await _stream_call(prompt, section, sink, max_tokens, allow_truncated)
+        except LLMTruncatedError:
+            # Como en chat(): un intento más con presupuesto mayor; el cliente descarta lo ya recibido
+            sink(section, None)
+            record_request("reintento")
+            larger = int(max_tokens * LLM_TRUNCATION_GROWTH)
+            content = await _stream_call(prompt, section, sink, larger, allow_truncated)
+    if not content:
+        raise ValueError("El LLM devolvió una respuesta vacía")
+    return content
+
+def gpt(prompt, max_tokens=None):
+    # Versión síncrona para llamadas sueltas fuera de un event loop
+    async def run():
+        try:
+            return await agpt(prompt, max_tokens=max_tokens)
+        finally:
+            await get_client().aclose()
+    return asyncio.run(run())
 
 def extract_concepts(titulo):
-    prompt = (
-        f"Del siguiente título académico: {titulo}, extrae dos conceptos principales: uno técnico desde la profesión del usuario y otro contextual desde el entorno o sector involucrado. "
-        f"Devuélvelos sin comillas, en minúsculas, sin numeración, separados por salto de línea."
-    )
-    resultado = gpt(prompt)
+    prompt = render_prompt("conceptos_clave", {"titulo": titulo})
+    resultado = gpt(prompt, max_tokens=max_tokens_for("conceptos_clave"))
     return [v.strip() for v in resultado.split("\n") if v.strip()]
 
-def generate_article(tema, nivel, pais):
-    doc = Document()
-    doc.add_heading("Artículo generado automáticamente", 0)
-    doc.add_paragraph(f"Tema ingresado: {tema}")
-    doc.add_paragraph(f"Nivel de indexación: {nivel}")
-    doc.add_paragraph("")
-
-    # TÍTULO
-    prompt_titulo = (
-        f"A partir del siguiente input informal: '{tema}', genera un título académico formal con redacción Scopus. "
-        f"Debe contener una combinación entre un concepto técnico derivado de la carrera y otro del entorno. "
-        f"No repitas frases del input, no uses comillas ni fórmulas genéricas como 'un estudio sobre' o 'intersección entre'."
-    )
-    titulo = gpt(prompt_titulo)
-    doc.add_heading(titulo, level=1)
-    time.sleep(2)
+# PROMPTS POR SECCIÓN (cada uno recibe los resultados ya disponibles en `r`; las plantillas están en prompts.py)
+
+def prompt_titulo(r):
+    return render_prompt("titulo", r)
+
+def prompt_contexto(r):
+    return render_prompt("contexto", r)
 
-    # CONTEXTO GENERAL
-    contexto = gpt(
-        f"Redacta un texto así sobre la problemática del artículo titulado '{titulo}', mismo tamaño, mismo 1 párrafo, recuerda, sin usar datos cuantitativos, NO MENCIONES EL TITULO DE LA INVESTIGACION. HAZLO COMO ESTE MODELO: Los polifenoles han demostrado tener un impacto positivo en la reducción de los niveles lipídicos en estudios con Rattus. Se ha encontrado que la administración de diversos extractos de plantas, frutas y otras fuentes naturales en ratas y ratones, que contienen altos niveles de polifenoles contribuyen a disminuir significativamente los niveles de colesterol, triglicéridos y lipoproteínas en ratas y ratones, con reducciones que oscilan entre el 15% y el 30% en comparación con grupos de control. Es así que un producto que también tiene estas características es el Rubus spp. que contiene antioxidantes y compuestos fenólicos que por sus propiedades bioactivas también pueden contribuir a la mejora del perfil lipídico, lo que revela un potencial efecto hipolipemiante. Su potencial la convierte en un candidato interesante para futuros estudios en el ámbito de la nutrición y la salud. Además, su fácil acceso y bajo costo pueden facilitar su incorporación en la dieta de diversas poblaciones. Por lo tanto, es esencial seguir investigando los efectos de la moral en la salud cardiovascular y su uso en estrategias de prevención. Por lo que, la mora Rubus spp. representa una opción viable y beneficiosa en el manejo de la hiperlipidemia en ratas."
+def prompt_mundial_latam_peru(r):
+    return render_prompt("mundial_latam_peru", r)
+
+def prompt_problema(r):
+    return render_prompt("problema", r)
+
+def prompt_justificacion(r):
+    return render_prompt("justificacion", r)
+
+def prompt_teorias(r):
+    return render_prompt("teorias", r)
+
+def prompt_conceptos(r):
+    return render_prompt("conceptos", r)
+
+def _gpt_section(name, prompt_builder):
+    async def run(r):
+        return await agpt(prompt_builder(r), section=name)
+    return run
+
+# GRAFO DE SECCIONES: todo depende solo del título, así que tras él se generan en paralelo
+SECTIONS = [
+    Section("titulo", _gpt_section("titulo", prompt_titulo)),
+    Section("contexto", _gpt_section("contexto", prompt_contexto), depends_on=["titulo"]),
+    Section("mundial_latam_peru", _gpt_section("mundial_latam_peru", prompt_mundial_latam_peru), depends_on=["titulo"]),
+    Section("problema", _gpt_section("problema", prompt_problema), depends_on=["titulo"]),
+    Section("justificacion", _gpt_section("justificacion", prompt_justificacion), depends_on=["titulo"]),
+    Section("teorias", _gpt_section("teorias", prompt_teorias), depends_on=["titulo"]),
+    Section("conceptos", _gpt_section("conceptos", prompt_conceptos), depends_on=["titulo"]),
+]
+
+# MODO ESTRUCTURADO: las secciones se agrupan en dos llamadas JSON (cada una cabe en max_tokens)
+# y cada grupo declara los campos que debe devolver. Solo se vuelve a pedir el campo que falte.
+
+STRUCTURED_GROUPS = {
+    "planteamiento": [
+        (("contexto",), prompt_contexto),
+        (("mundial", "latam", "peru"), prompt_mundial_latam_peru),
+        (("problema",), prompt_problema),
+        (("justificacion",), prompt_justificacion),
+    ],
+    "marco_teorico": [
+        (("teoria1", "teoria2"), prompt_teorias),
+        (("concepto1_p1", "concepto1_p2", "concepto2_p1", "concepto2_p2"), prompt_conceptos),
+    ],
+}
+
+STRUCTURED_FIELDS = {
+    "planteamiento": {
+        "contexto": Field("párrafo de contexto de la problemática, sin datos cuantitativos", 170),
+        "mundial": Field("párrafo de nivel global o mundial", 100),
+        "latam": Field("párrafo de nivel Latinoamérica", 100),
+        "peru": Field("párrafo de nivel nacional del país", 100),
+        "problema": Field("párrafo de problema, causas y consecuencias", 90),
+        "justificacion": Field("párrafo de justificación que empieza con \"se justifica\"", 100),
+    },
+    "marco_teorico": {
+        "teoria1": Field("párrafo de la primera teoría", 150),
+        "teoria2": Field("párrafo de la segunda teoría", 150),
+        "concepto1_p1": Field("primer párrafo de la primera variable", 100),
+        "concepto1_p2": Field("segundo párrafo de la primera variable", 100),
+        "concepto2_p1": Field("primer párrafo de la segunda variable", 100),
+        "concepto2_p2": Field("segundo párrafo de la segunda variable", 100),
+        "concepto2_p3": Field("párrafo adicional y opcional de la segunda variable", 100, required=False),
+    },
+}
+
+def prompt_grupo(name, r):
+    partes = "\n\n".join(
+        f"[{', '.join(claves)}] {builder(r)}" for claves, builder in STRUCTURED_GROUPS[name]
     )
-    time.sleep(2)
-
-    # MUNDIAL / LATAM / PAÍS SELECCIONADO
-    mundial_latam_peru = gpt(
-        f"Redacta un texto de 3 párrafos, c/u de 100 palabras, todo estilo scopus q1, sobre la problemática del artículo titulado '{titulo}'. "
-        f"Cada párrafo es por un nivel: el primer párrafo nivel global o mundial, segundo nivel LATAM, tercero nivel nacional del país {pais}. "
-        f"Cada párrafo debe tener 3 datos cuantitativos (solo uno porcentual, los otros 2 numericos, IMPORTANTEeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeee). "
-        f"No incluyas citas ni menciones a instituciones (IMPORTANTISIMO) ni ambigüedades como 'cerca de' o 'casi'. No uses conectores de cierre. "
-        f"Cada párrafo debe iniciar mencionando el nivel (ejemplo: A nivel global, En Latinoamérica, En el contexto de {pais}). "
-        f"Además, cada párrafo debe tener 2 datos cualitativos. TODA SOLO INFORMACION DE LOS ULTIMOS 5 AÑOS. importante, no uses la palabra \"CUALITATIVA\" ni similares"
+    return (
+        f"Vas a redactar varias partes del artículo titulado '{r['titulo']}'. Cada bloque indica entre corchetes "
+        f"las claves JSON en las que va cada párrafo; sigue sus indicaciones por separado.\n\n{partes}"
     )
-    mundial, latam, peru = mundial_latam_peru.split("\n")[:3]
-    time.sleep(2)
 
-    # PROBLEMA / CAUSAS / CONSECUENCIAS
-    problema = gpt(
-        f"Redáctame un párrafo como este sobre problema, causas y consecuencias sobre la problemática del artículo titulado '{titulo}', en 90 palabras, redactado como para scopus q1, sin datos cuantitativos, sin citas, sin tanta puntuación o separación en las oraciones, que sea un párrafo fluido. no menciones el titulo del articulo textualmente en este parrafo, Modelo: En ese sentido, se parte de la premisa que la administración de mora Rubus spp. en Rattus resulta en una reducción significativa de los niveles de lípidos en sangre (tratamiento de la hiperlipidemia). Se espera que los compuestos bioactivos presentes en Rubus spp., como polifenoles y antocianinas, contribuyan a mejorar el perfil lipídico y a mitigar los efectos adversos asociados con este trastorno metabólico. Por lo tanto, los experimentos en vivo constituyen una oportunidad para validar la eficacia de Rubus spp. como un enfoque natural en la prevención y manejo de la hiperlipidemia."
-    )
-    time.sleep(2)
+def _structured_section(name):
+    async def run(r):
+        ask = lambda prompt, max_tokens=None, allow_truncated=False: agpt(
+            prompt, section=name, max_tokens=max_tokens, allow_truncated=allow_truncated)
+        return await generate_structured(ask, prompt_grupo(name, r), STRUCTURED_FIELDS[name])
+    return run
 
-    # JUSTIFICACIÓN
-    justificacion = gpt(
-        f"Redacta un párrafo de justificación, por relevancia, importancia, etc. (no lo hagas por niveles tipo tesis teórica, práctica o metodológica), de 100 palabras, estilo scopus q1, que empiece con la primera oración con preámbulo que contenga \"se justifica\", para el artículo titulado '{titulo}'. Sin mencionar el título del artículo en esta justificación."
-    )
-    time.sleep(2)
+STRUCTURED_SECTIONS = [
+    Section("titulo", _gpt_section("titulo", prompt_titulo)),
+    Section("planteamiento", _structured_section("planteamiento"), depends_on=["titulo"]),
+    Section("marco_teorico", _structured_section("marco_teorico"), depends_on=["titulo"]),
+]
 
-    # MARCO TEÓRICO
-    doc.add_heading("Marco teórico", level=2)
+def sections_for(mode=None):
+    return STRUCTURED_SECTIONS if (mode or GENERATION_MODE) == "json" else SECTIONS
 
-    # TEORÍA 1
-    teorias = gpt(
-        f"A partir de esta investigación titulada '{titulo}', busca 2 teorías en las que se podría basar, y de ellas, de cada una, redacta un párrafo de 150 palabras que tenga en la primera oración una especie de preámbulo, y a partir de la segunda ya menciones el nombre de la teoría, el padre (principal propulsor) y de qué trata. Importante: no menciones el título de la investigación en ningún párrafo ni uses conectores de cierre. Sin subtítulos, todo prosa. NO MENCIONES LIBROS. NO USES AMBIGUEDADES COMO, PODRIA SER, TODO EXACTO, EN VEZ DE PORDRIA SER, PON, ES. NO USES LAS PALABRAS, POR EJEMPLO, CRUCIAL"
-    )
-    teoria1, teoria2 = teorias.split("\n\n")[:2]
-    time.sleep(2)
+# DIVISIÓN DE CADA SECCIÓN EN LOS BLOQUES DE `generated_text`
 
-    # VARIABLES (2 x 2 párrafos)
-    conceptos = gpt(
-        f"A partir de esta investigación titulada '{titulo}', extrae sus dos variables principales (generales, sin especificación). Luego, de cada una redacta un texto de dos párrafos (IMPORTANTE en total 4 PARRAFOS), cada párrafo de 100 palabras. IMPORTANTE: Cada párrafo debe comenzar con un CONECTOR DE ADICION (EJEMPLOS: de manera concordante, en consonancia con lo anterior, siguiendo esa orientación) ESTO ES IMPORTANTISIMOOOOO, y a partir de la segunda desarrollar definición, características, tipos, conceptos, etc. Ambos textos deben ir en prosa continua, sin subtítulos, IMPORTANTE: NO EXPLIQUES QUE HAS ESCOGIDO LAS VARIABLES, NO UTILICES LA PALABRA VARIABLE NI SIMILARES, NO MENCIONAR EL TITULO DE LA INVESTIGACION, NO HABLES EN PRIMERA PERSONA (EJ: HABLAMOS) IMPORTANTEEEEEEEEEEEEEEEEEEEEEEE. NO USES CONECTORES DE CIERRE. LEE TODAS LAS INIDCACIONES."
-    )
-    conceptos_divididos = conceptos.split("\n\n")
-    
-    # Proteger contra respuestas incompletas
-    while len(conceptos_divididos) < 5:
-        conceptos_divididos.append("")
-    
-    concepto1_p1, concepto1_p2 = conceptos_divididos[0], conceptos_divididos[1]
-    concepto2_p1, concepto2_p2, concepto2_p3 = conceptos_divididos[2], conceptos_divididos[3], conceptos_divididos[4]
-
-    generated_text = {
-        "contexto": contexto,
-        "mundial": mundial,
-        "latam": latam,
-        "peru": peru,
-        "problema": problema,
-        "justificacion": justificacion,
-        "teoria1": teoria1,
-        "teoria2": teoria2,
-        "concepto1_p1": concepto1_p1,
-        "concepto1_p2": concepto1_p2,
-        "concepto2_p1": concepto2_p1,
-        "concepto2_p2": concepto2_p2,
-        "concepto2_p3": concepto2_p3
+def _paragraphs(texto, required, optional=0):
+    # Párrafos no vacíos (una línea en blanco entre párrafos no cuenta como párrafo);
+    # los opcionales que falten quedan en "" y si faltan obligatorios se lanza ValueError
+    parrafos = [linea.strip() for linea in texto.split("\n") if linea.strip()]
+    if len(parrafos) < required:
+        raise ValueError(f"se esperaban {required} párrafos y llegaron {len(parrafos)}")
+    parrafos = parrafos[:required + optional]
+    return parrafos + [""] * (required + optional - len(parrafos))
+
+def _split_niveles(texto):
+    mundial, latam, peru = _paragraphs(texto, 3)
+    return {"mundial": mundial, "latam": latam, "peru": peru}
+
+def _split_teorias(texto):
+    teoria1, teoria2 = _paragraphs(texto, 2)
+    return {"teoria1": teoria1, "teoria2": teoria2}
+
+def _split_conceptos(texto):
+    # El tercer párrafo de la segunda variable es el único opcional
+    p1, p2, p3, p4, p5 = _paragraphs(texto, 4, optional=1)
+    return {
+        "concepto1_p1": p1,
+        "concepto1_p2": p2,
+        "concepto2_p1": p3,
+        "concepto2_p2": p4,
+        "concepto2_p3": p5
     }
 
-    from citation_generator import CitationGenerator
+SECTION_PARTS = {
+    "titulo": lambda texto: {"titulo": texto},
+    "contexto": lambda texto: {"contexto": texto},
+    "mundial_latam_peru": _split_niveles,
+    "problema": lambda texto: {"problema": texto},
+    "justificacion": lambda texto: {"justificacion": texto},
+    "teorias": _split_teorias,
+    "conceptos": _split_conceptos,
+}
+
+def section_parts(name, texto):
+    # En modo estructurado la sección ya llega como diccionario validado
+    if isinstance(texto, dict):
+        return dict(texto)
+    try:
+        return SECTION_PARTS[name](texto)
+    except ValueError as e:
+        # Menos párrafos de los esperados: mejor fallar que entregar secciones vacías o cortadas
+        raise SectionError(name, ValueError(f"la respuesta no tiene el número de párrafos esperado: {e}")) from e
+
+def split_sections(results):
+    generated_text = {}
+    for name, value in results.items():
+        if name != "titulo" and (name in SECTION_PARTS or name in STRUCTURED_FIELDS):
+            generated_text.update(section_parts(name, value))
+    return generated_text
+
+async def generate_article_async(tema, nivel, pais, max_parallel=None, on_section_done=None, semaphore=None, mode=None,
+                                 article_id=None):
+    with span("secciones"):
+        results = await run_sections(
+            sections_for(mode),
+            context={"tema": tema, "nivel": nivel, "pais": pais},
+            max_parallel=max_parallel,
+            on_section_done=on_section_done,
+            semaphore=semaphore
+        )
+    # Citas y DOCX son trabajo de CPU: fuera del event loop
+    state = await asyncio.to_thread(build_state, results, pais)
+    if article_id is not None:
+        # Se guarda el estado intermedio para poder regenerar secciones sueltas después
+        state.update({"tema": tema, "nivel": nivel, "pais": pais, "modo": mode or GENERATION_MODE})
+        await asyncio.to_thread(get_article_store().save, article_id, state)
+    return await asyncio.to_thread(render_state, state)
+
+def build_article(results):
+    # Devuelve los bytes del DOCX final
+    return render_state(build_state(results))
+
+def build_state(results, pais=None):
+    # Título, texto por bloque (con y sin citas), referencias y citas por bloque
+    titulo = results["titulo"]
+    generated_text = split_sections(results)
 
-    cg = CitationGenerator(title=titulo, generated_text=generated_text)
-    cg.generate_all_references()
-    cg.generate_all_citations()
-    text_with_citations = cg.insert_all_citations()
-    reference_list = cg.get_references_list()
+    cg = CitationGenerator(title=titulo, generated_text=generated_text, country=pais)
+    with span("citas_referencias"):
+        cg.generate_all_references()
+    with span("citas_generacion"):
+        cg.generate_all_citations()
+    with span("citas_insercion"):
+        text_with_citations = cg.insert_all_citations()
+    with span("citas_bibliografia"):
+        reference_list = cg.get_references_list()
+
+    return {
+        "titulo": titulo,
+        "generated_text": generated_text,
+        "text_with_citations": text_with_citations,
+        "reference_list": reference_list,
+        **cg.to_state(),
+    }
+
+def render_state(state):
+    # Arma el texto final a partir del estado y devuelve los bytes del DOCX
+    text_with_citations = state["text_with_citations"]
 
     final_article = ""
-    for key in [
-        "contexto", "mundial", "latam", "peru", "problema", "justificacion",
-        "teoria1", "teoria2",
-        "concepto1_p1", "concepto1_p2",
-        "concepto2_p1", "concepto2_p2", "concepto2_p3"
-    ]:
+    for key in ARTICLE_BLOCKS:
         if key in text_with_citations:
             final_article += text_with_citations[key] + "\n\n"
 
     final_article += "Referencias\n"
-    for ref in reference_list:
+    for ref in state["reference_list"]:
         final_article += ref + "\n"
 
     final_article = final_article.strip()  # ← ✅ Esto es nuevo
@@ -140,6 +315,84 @@ def generate_article(tema, nivel, pais):
     if not final_article:
         raise ValueError("El contenido del artículo está vacío. No se generará el Word.")
     
-    filename = f"articulo_{datetime.now().strftime('%Y%m%d%H%M%S')}.docx"
-    save_article_to_docx(final_article, filename)
-    return filename  
+    with span("docx"):
+        return render_article_docx(final_article)
+
+# REGENERACIÓN DE BLOQUES SUELTOS: una llamada por bloque, reutilizando título, referencias y citas
+
+ARTICLE_BLOCKS = [
+    "contexto", "mundial", "latam", "peru", "problema", "justificacion",
+    "teoria1", "teoria2",
+    "concepto1_p1", "concepto1_p2",
+    "concepto2_p1", "concepto2_p2", "concepto2_p3"
+]
+
+# Bloque -> (prompt de la sección a la que pertenece, campo del esquema)
+BLOCK_PROMPTS = {
+    key: (builder, fields[key])
+    for group, fields in STRUCTURED_FIELDS.items()
+    for keys, builder in STRUCTURED_GROUPS[group]
+    for key in keys
+}
+BLOCK_PROMPTS["concepto2_p3"] = (prompt_conceptos, STRUCTURED_FIELDS["marco_teorico"]["concepto2_p3"])
+
+async def regenerate_blocks_async(state, blocks, on_section_done=None):
+    # Devuelve el texto nuevo de cada bloque pedido (sin citas)
+    r = {"tema": state["tema"], "nivel": state["nivel"], "pais": state["pais"], "titulo": state["titulo"]}
+
+    async def one(block):
+        builder, field = BLOCK_PROMPTS[block]
+        try:
+            ask = lambda prompt, max_tokens=None, allow_truncated=False: agpt(
+                prompt, section=block, max_tokens=max_tokens, allow_truncated=allow_truncated)
+            texto = await repair_field(ask, builder(r), block, field)
+        except SectionError:
+            raise
+        except Exception as e:
+            raise SectionError(block, e) from e
+        if on_section_done is not None:
+            on_section_done(block, texto)
+        return block, texto
+
+    with span("secciones"):
+        return dict(await asyncio.gather(*(one(b) for b in blocks)))
+
+def apply_blocks(state, updated):
+    # Se vuelven a insertar citas en los bloques cambiados y, si el cambio renovó las fuentes de una
+    # teoría o variable, en todos los bloques que citan esas fuentes; el resto se reutiliza
+    cg = CitationGenerator.from_state(state["titulo"], state["generated_text"], state)
+    with span("citas_referencias"):
+        refreshed = cg.replace_blocks(updated)
+    text_with_citations = dict(state["text_with_citations"])
+    with span("citas_insercion"):
+        for block in cg.generated_text:
+            if block in updated or cg._index_key(block) in refreshed:
+                text_with_citations[block] = cg.insert_block_citations(block)
+    return {
+        **state,
+        "generated_text": cg.generated_text,
+        "text_with_citations": text_with_citations,
+        "reference_list": cg.get_references_list(),
+        **cg.to_state(),
+    }
+
+async def regenerate_article_async(article_id, blocks, on_section_done=None):
+    store = get_article_store()
+    state = await asyncio.to_thread(store.load, article_id)
+    if state is None:
+        raise KeyError(f"Artículo no encontrado: {article_id}")
+    updated = await regenerate_blocks_async(state, blocks, on_section_done=on_section_done)
+    # Los bloques nuevos se aplican sobre el estado vigente al guardar, no sobre el leído antes de las
+    # llamadas al LLM: así no se pierden los de otra regeneración que terminó mientras tanto
+    state = await asyncio.to_thread(store.merge, article_id, lambda current: apply_blocks(current, updated))
+    if state is None:
+        raise KeyError(f"Artículo no encontrado: {article_id}")
+    return await asyncio.to_thread(render_state, state)
+
+def generate_article(tema, nivel, pais, max_parallel=None, mode=None):
+    async def run():
+        try:
+            return await generate_article_async(tema, nivel, pais, max_parallel=max_parallel, mode=mode)
+        finally:
+            await get_client().aclose()
+    return asyncio.run(run())
@@ -1,65 +1,212 @@
 # generator_utils.py
 
-import random
+import itertools
+import re
+from reference_index import search
 
-def generate_apa_references(label: str, source_type: str = "cientifico") -> list:
-    """
-    Simula la búsqueda de referencias reales según el tema (label) y tipo de fuente.
-    En producción esto se conectaría con una API real como Semantic Scholar o Google Scholar.
-    """
+def _fallback_records(label: str, source_type: str) -> list:
+    # Registros de respaldo cuando el índice local no existe o no tiene coincidencias
     if source_type == "institucional":
         return [
-            f"World Health Organization. (2023). {label.capitalize()}. Geneva: WHO.",
-            f"UNESCO. (2022). {label.capitalize()} in Latin America. Paris: UNESCO.",
-            f"OECD. (2024). Global Report on {label.capitalize()}. OECD Publishing.",
-            f"UNICEF. (2023). Challenges of {label.lower()} in vulnerable populations."
+            {"authors": ["World Health Organization"], "year": 2023, "title": label.capitalize(), "venue": "Geneva: WHO", "doi": None},
+            {"authors": ["UNESCO"], "year": 2022, "title": f"{label.capitalize()} in Latin America", "venue": "Paris: UNESCO", "doi": None},
+            {"authors": ["OECD"], "year": 2024, "title": f"Global Report on {label.capitalize()}", "venue": "OECD Publishing", "doi": None},
+            {"authors": ["UNICEF"], "year": 2023, "title": f"Challenges of {label.lower()} in vulnerable populations", "venue": "", "doi": None}
         ]
     else:
         return [
-            f"Smith, J. (2023). Advances in {label.lower()} research. Journal of Applied Sciences, 45(3), 120–134.",
-            f"Lopez, M. & Wang, Y. (2022). Perspectives on {label.lower()} in modern education. Educational Review, 39(2), 88–101.",
-            f"Kumar, R. (2021). Conceptual analysis of {label.lower()}. International Journal of Research, 12(4), 55–70."
+            {"authors": ["Smith, J."], "year": 2023, "title": f"Advances in {label.lower()} research", "venue": "Journal of Applied Sciences, 45(3), 120–134", "doi": None},
+            {"authors": ["Lopez, M.", "Wang, Y."], "year": 2022, "title": f"Perspectives on {label.lower()} in modern education", "venue": "Educational Review, 39(2), 88–101", "doi": None},
+            {"authors": ["Kumar, R."], "year": 2021, "title": f"Conceptual analysis of {label.lower()}", "venue": "International Journal of Research, 12(4), 55–70", "doi": None}
         ]
 
+def find_references(label: str, source_type: str = "cientifico") -> list:
+    """
+    Busca referencias para el tema (label) en el índice local (reference_index.py).
+    Devuelve registros estructurados: authors, year, title, venue y doi.
+    """
+    limit = 4 if source_type == "institucional" else 3
+    records = list(search(label, source_type, limit))
+    return records or _fallback_records(label, source_type)
+
+def format_apa(record: dict) -> str:
+    """
+    Formatea un registro como referencia APA.
+    """
+    authors = record["authors"]
+    if len(authors) > 1:
+        autores = ", ".join(authors[:-1]) + ", & " + authors[-1]
+    else:
+        autores = authors[0] if authors else "Anónimo"
+    apa = f"{autores}{'' if autores.endswith('.') else '.'} ({record['year']}). {record['title']}."
+    if record.get("venue"):
+        apa += f" {record['venue']}."
+    if record.get("doi"):
+        apa += f" https://doi.org/{record['doi']}"
+    return apa
+
+def generate_apa_references(label: str, source_type: str = "cientifico") -> list:
+    """
+    Devuelve las referencias APA del tema (label) y tipo de fuente, consultando el índice local.
+    """
+    return [format_apa(r) for r in find_references(label, source_type)]
+
+def generate_references(label: str, source_type: str = "cientifico") -> list:
+    """
+    Igual que generate_apa_references pero devuelve objetos Reference (autores y año ya separados).
+    """
+    return [Reference.from_record(r) for r in find_references(label, source_type)]
+
+class Reference:
+    """
+    Referencia bibliográfica compacta: autores y año se separan una sola vez y el
+    texto APA queda calculado para ordenar y deduplicar sin volver a parsear.
+    """
+    __slots__ = ("authors", "year", "title", "venue", "doi", "apa", "author_label")
+
+    def __init__(self, authors, year, title, venue="", doi=None):
+        self.authors = tuple(authors)
+        self.year = str(year)
+        self.title = title
+        self.venue = venue or ""
+        self.doi = doi
+        self.apa = format_apa(self.to_dict())
+        self.author_label = _author_label(self.authors)
+
+    @classmethod
+    def from_record(cls, record: dict) -> "Reference":
+        return cls(record["authors"], record["year"], record["title"], record.get("venue", ""), record.get("doi"))
+
+    @classmethod
+    def from_apa(cls, apa: str) -> "Reference":
+        # Para cadenas APA ya formateadas (p. ej. de versiones anteriores)
+        match = _APA_RE.match(apa.strip())
+        if match is None:
+            raise ValueError(f"Referencia APA no reconocida: {apa}")
+        authors = [_clean_author(a) for a in _AUTHOR_SEP_RE.split(match.group("authors")) if a.strip()]
+        return cls(authors, match.group("year"), match.group("title"), (match.group("venue") or "").rstrip("."))
+
+    def to_dict(self) -> dict:
+        return {"authors": list(self.authors), "year": self.year, "title": self.title, "venue": self.venue, "doi": self.doi}
+
+    def __eq__(self, other):
+        return isinstance(other, Reference) and self.apa == other.apa
+
+    def __lt__(self, other):
+        return self.apa < other.apa
+
+    def __hash__(self):
+        return hash(self.apa)
+
+    def __repr__(self):
+        return f"Reference({self.apa!r})"
+
+_APA_RE = re.compile(r"^(?P<authors>.+?)\s\((?P<year>[^)]+)\)\.\s*(?P<title>.+?)\.(?:\s+(?P<venue>.*))?$")
+# Separa "Smith, J., & Lopez, M." o "Lopez, M. & Wang, Y." sin romper las iniciales
+_AUTHOR_SEP_RE = re.compile(r",?\s*&\s*|(?<=\.),\s+(?=[^\s,]+,)")
+
+def _clean_author(author: str) -> str:
+    author = author.strip()
+    # Las instituciones no llevan coma ni iniciales: se quita el punto final de APA
+    if "," not in author:
+        author = author.rstrip(".")
+    return author
+
+def _author_label(authors) -> str:
+    # Apellidos para la cita en texto: "Smith", "Lopez y Wang", "García et al."
+    surnames = [a.split(",")[0].strip() for a in authors] or ["Anónimo"]
+    if len(surnames) == 1:
+        return surnames[0]
+    if len(surnames) == 2:
+        return f"{surnames[0]} y {surnames[1]}"
+    return f"{surnames[0]} et al."
+
 def generate_textual_citations(apa_list: list) -> list:
     """
-    Alterna entre citas narrativas y parentéticas a partir de una lista APA.
+    Alterna entre citas narrativas y parentéticas a partir de una lista de referencias
+    (objetos Reference o cadenas APA).
     """
     citations = []
     for i, ref in enumerate(apa_list):
-        author = ref.split(".")[0]
-        year = ref.split("(")[1].split(")")[0]
+        if isinstance(ref, str):
+            ref = Reference.from_apa(ref)
         if i % 2 == 0:
-            citations.append(f"Además, {author} ({year})")
+            citations.append(f"Además, {ref.author_label} ({ref.year})")
         else:
-            citations.append(f"({author}, {year})")
+            citations.append(f"({ref.author_label}, {ref.year})")
     return citations
 
-def insert_citations_into_text(text: str, citations: list) -> str:
+# SEGMENTACIÓN EN ORACIONES
+
+_ABBREVIATIONS = {"spp", "sp", "al", "etc", "dr", "dra", "sr", "sra", "ej", "fig", "núm", "vol", "pp", "aprox", "vs", "ca"}
+_WHITESPACE_RE = re.compile(r"\s+")
+_EXCLAMATION_RE = re.compile(r"([!?]+)\s+(?=[^\sa-záéíóúñü])")
+# Punto final de oración: seguido de espacio y del fin del texto o de algo que no va en minúscula,
+# y que no cierra una abreviatura ni una inicial. El patrón empieza por un literal para que re
+# salte de punto en punto, y las abreviaturas van agrupadas por longitud en pocas búsquedas hacia atrás
+_PERIOD_RE = re.compile(
+    r"\.(?= +(?:[^\sa-zß-öø-ÿ]|$))"
+    + "".join(rf"(?<! (?i:{'|'.join(map(re.escape, sorted(words)))})\.)"
+              for _, words in itertools.groupby(sorted(_ABBREVIATIONS, key=len), key=len))
+    + r"(?<! [A-ZÀ-ÖØ-Þ]\.) +"
+)
+
+def split_sentences(text: str) -> list:
     """
-    Inserta una cita por oración, alternando entre narrativa y parentética,
-    dividiendo el párrafo si se repite una cita.
+    Divide el texto en pares (oración, puntuación final) sin cortar en abreviaturas
+    como "spp.", "et al." o iniciales, ni cuando la siguiente palabra va en minúscula.
     """
-    sentences = text.split(". ")
-    result = []
-    used = set()
-    current_para = []
+    if "\n" in text or "\t" in text:
+        text = _WHITESPACE_RE.sub(" ", text)
 
-    for i, sentence in enumerate(sentences):
-        if not sentence.strip():
-            continue
+    # Con el espacio inicial toda palabra va precedida de uno, como esperan las búsquedas hacia atrás
+    pieces = _PERIOD_RE.split(" " + text)
+    last = pieces[-1].rstrip()
+    pieces[-1] = last.rstrip(".!?")
+    puncts = ["."] * (len(pieces) - 1) + [last[len(pieces[-1]):] or "."]
+    if "!" in text or "?" in text:
+        pieces, puncts = _split_exclamations(pieces, puncts)
+    return [(piece, punct) for piece, punct in zip(map(str.strip, pieces), puncts) if piece]
 
-        citation = citations[i % len(citations)]
+def _split_exclamations(pieces: list, puncts: list):
+    # Corta además en "!" y "?" dentro de cada trozo; son raros en el texto, así que va aparte
+    split_pieces, split_puncts = [], []
+    for piece, punct in zip(pieces, puncts):
+        parts = _EXCLAMATION_RE.split(piece) if "!" in piece or "?" in piece else [piece]
+        split_pieces.extend(parts[0::2])
+        split_puncts.extend(parts[1::2])
+        split_puncts.append(punct)
+    return split_pieces, split_puncts
 
+def insert_citations(sentences: list, citations: list) -> str:
+    """
+    Inserta una cita por oración, alternando entre narrativa y parentética,
+    y abre un párrafo nuevo cuando una cita se repetiría en el mismo párrafo.
+    """
+    paragraphs = []
+    current_para = []
+    used = set()
+    n = len(citations)
+
+    for i, (sentence, punct) in enumerate(sentences):
+        citation = citations[i % n]
         if citation in used:
-            result.append(". ".join(current_para) + ".")
-            current_para = [f"{sentence.strip()} {citation}"]
-            used = {citation}
-        else:
-            current_para.append(f"{sentence.strip()} {citation}")
-            used.add(citation)
+            paragraphs.append(" ".join(current_para))
+            current_para = []
+            used = set()
+        current_para.append(f"{sentence} {citation}{punct}")
+        used.add(citation)
 
     if current_para:
-        result.append(". ".join(current_para) + ".")
+        paragraphs.append(" ".join(current_para))
+
+    return "\n\n".join(paragraphs)
 
-    return "\n\n".join(result)
+def insert_citations_into_text(text: str, citations: list) -> str:
+    """
+    Inserta una cita por oración, alternando entre narrativa y parentética,
+    dividiendo el párrafo si se repite una cita. Sin citas, el texto queda igual.
+    """
+    if not citations:
+        return text
+    return insert_citations(split_sentences(text), citations)
@@ -0,0 +1,224 @@
+# jobs.py
+
+import asyncio
+import itertools
+import os
+import time
+import uuid
+from typing import Dict, Optional
+
+from metrics import COALESCED, JOB_QUEUE_WAIT, JOB_SECONDS, JOBS
+
+# Trabajadores simultáneos y profundidad máxima de la cola de artículos
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_DEPTH = int(os.getenv("JOB_QUEUE_DEPTH", "32"))
+# Segundos que se conserva un trabajo terminado antes de olvidarlo
+JOB_TTL = int(os.getenv("JOB_TTL", "3600"))
+# Duración supuesta de un artículo hasta que haya mediciones reales (para estimar la espera)
+JOB_SECONDS_ESTIMATE = float(os.getenv("JOB_SECONDS_ESTIMATE", "60"))
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, tema: str, nivel: str, pais: str, sections, cache: str = None, stream: bool = False,
+                 trace: bool = False, mode: str = None, article_id: str = None, blocks=None,
+                 client: str = None, priority: int = 1, batch=None):
+        self.id = uuid.uuid4().hex
+        # Cliente (API key o IP) para la cuota de concurrencia; menor prioridad se atiende antes
+        self.client = client
+        self.priority = priority
+        self.estimated_wait: Optional[float] = None
+        # Un artículo nuevo toma el id del trabajo; una regeneración apunta al artículo existente
+        self.article_id = article_id or self.id
+        self.blocks = list(blocks) if blocks else None
+        # Entradas de un lote (/generar/batch): el resultado es un ZIP con un DOCX por artículo
+        self.batch = list(batch) if batch else None
+        # Solicitudes idénticas que se unieron a este trabajo en vez de generar otro artículo
+        self.coalesced = 0
+        self.key = None
+        self.tema = tema
+        self.nivel = nivel
+        self.pais = pais
+        self.cache = cache
+        self.mode = mode
+        self.status = "en_cola"
+        self.progress = {name: "pendiente" for name in sections}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Eventos para clientes que siguen el trabajo en streaming (SSE)
+        self.events: Optional[asyncio.Queue] = asyncio.Queue() if stream else None
+        # Spans de la traza JSON del artículo, si se pidió
+        self.trace = [] if trace else None
+        # Tokens consumidos por sección (se llena desde metrics.record_tokens)
+        self.usage: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def weight(self) -> int:
+        # Artículos que representa en la estimación de espera: un lote cuenta por cada entrada
+        return len(self.batch) if self.batch else 1
+
+    def emit(self, event: str, data: Dict[str, object]):
+        if self.events is not None:
+            self.events.put_nowait((event, data))
+
+    def stream_token(self, section: str, delta: Optional[str]):
+        # Receptor de generator.token_sink: delta None descarta lo enviado de la sección (se reintenta)
+        if delta is None:
+            self.emit("reset", {"section": section})
+        else:
+            self.emit("token", {"section": section, "delta": delta})
+
+    def section_done(self, name: str, parts: Dict[str, str] = None):
+        if name in self.progress:
+            self.progress[name] = "listo"
+        self.emit("section", {"section": name, "parts": parts or {}})
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "job_id": self.id,
+            "article_id": self.article_id,
+            "status": self.status,
+            "tema": self.tema,
+            "nivel": self.nivel,
+            "pais": self.pais,
+            "modo": self.mode,
+            "articulos": len(self.batch) if self.batch else None,
+            "progress": self.progress,
+            "coalesced": self.coalesced,
+            "tokens": self.usage,
+            # Con el runner de main.py el resultado es el id del DOCX en el almacén de artefactos
+            "artifact_id": self.result if isinstance(self.result, str) else None,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    Cola acotada y con prioridad de artículos atendida por un número fijo de trabajadores async.
+    `runner(job)` es la corrutina que genera el artículo y devuelve su resultado.
+    Lleva la cuenta de trabajos activos por cliente y la duración media para estimar esperas.
+    """
+
+    def __init__(self, runner, workers: int = JOB_WORKERS, depth: int = JOB_QUEUE_DEPTH, ttl: int = JOB_TTL):
+        self.runner = runner
+        self.workers = workers
+        self.depth = depth
+        self.ttl = ttl
+        self.jobs: Dict[str, Job] = {}
+        # Trabajos en cola o en proceso por clave de solicitud, para agrupar duplicados (single-flight)
+        self.inflight: Dict[tuple, Job] = {}
+        # Trabajos en cola o en proceso por cliente; artículos en cola por prioridad y en proceso
+        self.active: Dict[str, int] = {}
+        self.queued: Dict[int, int] = {}
+        self.running = 0
+        # Media móvil exponencial de la duración de un trabajo
+        self.avg_seconds = JOB_SECONDS_ESTIMATE
+        self.order = itertools.count()
+        self.queue: Optional[asyncio.PriorityQueue] = None
+        self.tasks = []
+
+    def start(self):
+        self.queue = asyncio.PriorityQueue(maxsize=self.depth)
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def submit(self, job: Job, key: tuple = None) -> Job:
+        """
+        Encola `job`. Si se da `key` y ya hay un trabajo en vuelo con la misma clave,
+        no se encola nada y se devuelve ese trabajo, que comparte su resultado.
+        """
+        self._prune()
+        running = self.find_inflight(key)
+        if running is not None:
+            running.coalesced += 1
+            COALESCED.inc(capa="generar")
+            return running
+        try:
+            # A igual prioridad se respeta el orden de llegada
+            self.queue.put_nowait((job.priority, next(self.order), job))
+        except asyncio.QueueFull:
+            raise QueueFullError("La cola de generación está llena, inténtalo más tarde.")
+        self.jobs[job.id] = job
+        self.queued[job.priority] = self.queued.get(job.priority, 0) + job.weight
+        if job.client is not None:
+            self.active[job.client] = self.active.get(job.client, 0) + 1
+        if key is not None:
+            self.inflight[key] = job
+            job.key = key
+        return job
+
+    def find_inflight(self, key: tuple = None) -> Optional[Job]:
+        running = self.inflight.get(key) if key is not None else None
+        return running if running is not None and running.finished_at is None else None
+
+    def estimate_wait(self, priority: int) -> float:
+        """
+        Segundos estimados hasta que empiece un trabajo nuevo de esta prioridad: los de igual o
+        mayor prioridad ya en cola van antes, y cada trabajador libera un hueco cada `avg_seconds`.
+        Se cuenta en artículos, de modo que un lote pesa tanto como sus entradas.
+        """
+        ahead = sum(n for p, n in self.queued.items() if p <= priority) + self.running
+        if ahead < self.workers:
+            return 0.0
+        return (ahead - self.workers + 1) / self.workers * self.avg_seconds
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def _prune(self):
+        # Olvida los trabajos terminados hace más de `ttl` segundos
+        limit = time.time() - self.ttl
+        for job_id, job in list(self.jobs.items()):
+            if job.finished_at is not None and job.finished_at < limit:
+                del self.jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self.queue.get()
+            self.queued[job.priority] -= job.weight
+            self.running += job.weight
+            job.status = "en_proceso"
+            job.started_at = time.time()
+            JOB_QUEUE_WAIT.observe(job.started_at - job.created_at)
+            try:
+                job.result = await self.runner(job)
+                job.status = "completado"
+                job.emit("done", {"job_id": job.id, "download_url": f"/generar/{job.id}/descargar"})
+            except Exception as e:
+                print(f"Error en trabajo {job.id}: {str(e)}")
+                job.status = "error"
+                job.error = str(e)
+                # Las fallas de sección (SectionError) indican qué parte del artículo no se pudo generar
+                section = getattr(e, "section", None)
+                if section in job.progress:
+                    job.progress[section] = "error"
+                job.emit("error", {"job_id": job.id, "error": job.error, "section": section})
+            finally:
+                job.finished_at = time.time()
+                self.running -= job.weight
+                # Los lotes duran varios artículos: no entran en la media de un artículo
+                if job.status == "completado" and not job.batch:
+                    self.avg_seconds += 0.2 * ((job.finished_at - job.started_at) - self.avg_seconds)
+                if job.client is not None:
+                    self.active[job.client] -= 1
+                    if not self.active[job.client]:
+                        del self.active[job.client]
+                if job.key is not None and self.inflight.get(job.key) is job:
+                    del self.inflight[job.key]
+                JOB_SECONDS.observe(job.finished_at - job.started_at, estado=job.status)
+                JOBS.inc(estado=job.status)
+                self.queue.task_done()
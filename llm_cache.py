@@ -0,0 +1,181 @@
+# llm_cache.py
+
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from storage import SQLiteDatabase, lazy_singleton
+
+# Modo global: "on" (caché normal), "off", "record" (siempre llama y guarda) o "replay" (sin red)
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "on")
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+# Cada cuántas escrituras se borran de disco las filas vencidas
+LLM_CACHE_PRUNE_EVERY = int(os.getenv("LLM_CACHE_PRUNE_EVERY", "200"))
+
+# Política por solicitud: None (usar caché), "bypass" (ni leer ni guardar) o "refresh" (no leer, sí guardar)
+cache_policy: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("cache_policy", default=None)
+
+
+class CacheMissError(Exception):
+    pass
+
+
+def cache_key(model: str, prompt: str, temperature: float, max_tokens: int) -> str:
+    raw = json.dumps([model, prompt, temperature, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryLRU:
+    """LRU acotado en memoria con expiración por antigüedad."""
+
+    def __init__(self, size: int = LLM_CACHE_SIZE, ttl: float = LLM_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            value, stored_at = item
+            if self.ttl and time.time() - stored_at > self.ttl:
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, stored_at: float = None):
+        # stored_at conserva la antigüedad original al subir a memoria una entrada leída de disco
+        with self.lock:
+            self.items[key] = (value, stored_at or time.time())
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+class SQLiteStore(SQLiteDatabase):
+    """
+    Caché persistente en SQLite (modo WAL) compartida entre workers de uvicorn.
+    Las filas más antiguas que `ttl` no se devuelven y se borran cada `prune_every` escrituras.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL, prune_every: int = LLM_CACHE_PRUNE_EVERY):
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self.writes = 0
+        super().__init__(
+            path,
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, model TEXT, prompt TEXT, response TEXT, created_at REAL)",
+            "CREATE INDEX IF NOT EXISTS llm_cache_created ON llm_cache (created_at)",
+        )
+        self.prune()
+
+    def oldest_valid(self) -> float:
+        # Marca de tiempo mínima de una fila vigente (0 si no hay TTL)
+        return time.time() - self.ttl if self.ttl else 0.0
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        # Devuelve (respuesta, created_at) o None si no existe o ya venció
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ? AND created_at > ?",
+                (key, self.oldest_valid())
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def prune(self) -> int:
+        if not self.ttl:
+            return 0
+        with self.lock:
+            deleted = self.conn.execute("DELETE FROM llm_cache WHERE created_at <= ?", (self.oldest_valid(),)).rowcount
+            self.conn.commit()
+        return deleted
+
+    def set(self, key: str, model: str, prompt: str, response: str):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, prompt, response, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, prompt, response, time.time())
+            )
+            self.conn.commit()
+            self.writes += 1
+            prune = self.prune_every and self.writes % self.prune_every == 0
+        if prune:
+            self.prune()
+
+
+class LLMCache:
+    """
+    Caché de dos niveles para respuestas del LLM: LRU en memoria y SQLite en disco.
+    Lleva contadores de aciertos/fallos por nivel.
+    """
+
+    def __init__(self, mode: str = LLM_CACHE_MODE, memory: MemoryLRU = None, store: SQLiteStore = None):
+        self.mode = mode
+        self.memory = memory or MemoryLRU()
+        self._store = store
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "bypassed": 0}
+
+    @property
+    def store(self) -> SQLiteStore:
+        # Se abre en el primer uso para no tocar disco al importar
+        # Las grabaciones de record/replay no vencen: replay no puede volver a pedirlas a la red
+        if self._store is None:
+            self._store = SQLiteStore(ttl=0 if self.mode in ("record", "replay") else self.memory.ttl)
+        return self._store
+
+    def policy(self, policy: Optional[str] = None) -> Optional[str]:
+        return policy if policy is not None else cache_policy.get()
+
+    def lookup(self, key: str, policy: Optional[str] = None) -> Optional[str]:
+        # En replay no hay red: la política por solicitud ("bypass"/"refresh") no aplica y lo que no
+        # esté grabado es un error en vez de una llamada real
+        policy = None if self.mode == "replay" else self.policy(policy)
+        if self.mode in ("off", "record") or policy in ("bypass", "refresh"):
+            self.stats["bypassed"] += 1
+            return None
+
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            return value
+
+        row = self.store.get(key)
+        if row is not None:
+            value, created_at = row
+            self.stats["disk_hits"] += 1
+            self.memory.set(key, value, stored_at=created_at)
+            return value
+
+        self.stats["misses"] += 1
+        if self.mode == "replay":
+            raise CacheMissError(f"Respuesta no grabada para la clave {key} (modo replay)")
+        return None
+
+    def save(self, key: str, model: str, prompt: str, response: str, policy: Optional[str] = None):
+        # replay nunca escribe: la grabación solo cambia en modo record
+        if self.mode in ("off", "replay") or self.policy(policy) == "bypass":
+            return
+        self.memory.set(key, response)
+        self.store.set(key, model, prompt, response)
+        self.stats["writes"] += 1
+
+    def get_stats(self) -> Dict[str, object]:
+        return {"mode": self.mode, "memory_items": len(self.memory.items), **self.stats}
+
+
+get_cache = lazy_singleton(LLMCache)
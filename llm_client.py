@@ -0,0 +1,406 @@
+# llm_client.py
+
+import asyncio
+import collections
+import os
+import random
+import threading
+import time
+import weakref
+
+from llm_cache import cache_key, get_cache
+from metrics import current_section, observe_stage, record_request, record_tokens
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4")
+# Cuota de la cuenta: solicitudes y tokens por minuto (ajustar al tier real de OpenAI)
+LLM_RPM = float(os.getenv("LLM_RPM", "500"))
+LLM_TPM = float(os.getenv("LLM_TPM", "40000"))
+# Máximo de solicitudes en vuelo y tamaño del pool de conexiones HTTP
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "16"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "32"))
+# Plazo por intento y plazo total de la llamada (reintentos incluidos), en segundos
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "90"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "240"))
+# Reintentos ante 429/5xx/timeouts con backoff exponencial y jitter completo
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+# Una respuesta cortada en max_tokens se pide una vez más con el presupuesto multiplicado por este factor
+LLM_TRUNCATION_GROWTH = float(os.getenv("LLM_TRUNCATION_GROWTH", "2"))
+# Solicitud duplicada cuando una llamada supera el p95 de su sección (1 para activarla)
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+
+_openai = None
+
+
+def load_openai():
+    # openai (y aiohttp) se importan en el primer uso para que arrancar la API sea rápido
+    global _openai
+    if _openai is None:
+        import openai
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+        _openai = openai
+    return _openai
+
+
+class LLMTimeoutError(Exception):
+    pass
+
+
+class LLMTruncatedError(Exception):
+    # La respuesta llegó cortada en max_tokens (finish_reason == "length")
+    pass
+
+
+def is_retryable(error: BaseException) -> bool:
+    # Límite de cuota, errores del servidor, cortes de conexión y plazos vencidos
+    if isinstance(error, (LLMTimeoutError, asyncio.TimeoutError)):
+        return True
+    errors = load_openai().error
+    if isinstance(error, (errors.RateLimitError, errors.ServiceUnavailableError, errors.APIConnectionError,
+                          errors.Timeout, errors.TryAgain)):
+        return True
+    if isinstance(error, errors.APIError):
+        return (error.http_status or 500) >= 500
+    return False
+
+
+def backoff_delay(attempt: int, error: BaseException = None) -> float:
+    # Jitter completo sobre un tope exponencial; si OpenAI indica Retry-After, no esperar menos
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return max(delay, float(headers.get("retry-after", 0)))
+    except (TypeError, ValueError):
+        return delay
+
+
+class LatencyWindow:
+    """Últimas duraciones correctas por sección, para decidir cuándo duplicar una solicitud."""
+
+    def __init__(self, size: int = 200, min_samples: int = LLM_HEDGE_MIN_SAMPLES):
+        self.size = size
+        self.min_samples = min_samples
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add(self, section: str, seconds: float):
+        with self.lock:
+            window = self.samples.get(section)
+            if window is None:
+                window = self.samples[section] = collections.deque(maxlen=self.size)
+            window.append(seconds)
+
+    def p95(self, section: str):
+        with self.lock:
+            window = sorted(self.samples.get(section, ()))
+        if len(window) < self.min_samples:
+            return None
+        return window[int(len(window) * 0.95) - 1]
+
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    # tiktoken es opcional: si no está instalado se usa la aproximación de ~4 caracteres por token
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    try:
+                        _encoding = tiktoken.encoding_for_model(LLM_MODEL)
+                    except KeyError:
+                        _encoding = tiktoken.get_encoding("cl100k_base")
+                except ImportError:
+                    _encoding = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return len(text) // 4
+
+
+def estimate_tokens(prompt: str, max_tokens: int) -> int:
+    # OpenAI descuenta max_tokens de la cuota por minuto al recibir la solicitud,
+    # así que reservamos lo mismo más los tokens del prompt
+    return count_tokens(prompt) + max_tokens
+
+
+class TokenBucket:
+    """
+    Cubeta de tokens que se rellena de forma continua a `rate_per_minute`.
+    Es segura entre hilos para que la cuota se comparta en todo el proceso.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        # Segundos hasta que haya `amount` disponibles (0 si ya los hay). Requiere el lock.
+        self._refill(time.monotonic())
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Limita a la vez solicitudes por minuto (RPM) y tokens por minuto (TPM)."""
+
+    def __init__(self, rpm: float = LLM_RPM, tpm: float = LLM_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    async def acquire(self, tokens: int):
+        while True:
+            with self.requests.lock, self.tokens.lock:
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if wait == 0:
+                    self.requests.tokens -= 1
+                    self.tokens.tokens -= min(tokens, self.tokens.capacity)
+                    return
+            await asyncio.sleep(wait)
+
+
+class LLMClient:
+    """
+    Cliente async de chat con conexiones HTTP reutilizadas, límite de solicitudes en vuelo
+    y limitador RPM/TPM compartido. Cada event loop tiene su propia sesión y semáforo.
+    """
+
+    def __init__(self, model: str = LLM_MODEL, max_in_flight: int = LLM_MAX_IN_FLIGHT,
+                 pool_size: int = LLM_POOL_SIZE, limiter: RateLimiter = None):
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self.pool_size = pool_size
+        self.limiter = limiter or RateLimiter()
+        self.latencies = LatencyWindow()
+        self._loops = weakref.WeakKeyDictionary()
+
+    def _state(self):
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None or state[0].closed:
+            import aiohttp
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            state = (aiohttp.ClientSession(connector=connector), asyncio.Semaphore(self.max_in_flight))
+            self._loops[loop] = state
+        return state
+
+    async def chat(self, prompt: str, temperature: float = 0.65, max_tokens: int = 2000,
+                   cache: str = None, allow_truncated: bool = False) -> str:
+        # `cache` permite forzar "bypass" o "refresh" para esta llamada. Con `allow_truncated` una
+        # respuesta cortada en max_tokens se devuelve tal cual (el llamador rescata lo completo)
+        key = cache_key(self.model, prompt, temperature, max_tokens)
+        cached = await asyncio.to_thread(get_cache().lookup, key, cache)
+        if cached is not None:
+            record_request("cache")
+            return cached
+
+        try:
+            try:
+                content = await self._with_retries(
+                    lambda timeout: self._hedged(prompt, temperature, max_tokens, timeout, allow_truncated))
+            except LLMTruncatedError:
+                # Un solo intento más con presupuesto mayor; si vuelve a cortarse, la sección falla
+                record_request("reintento")
+                larger = int(max_tokens * LLM_TRUNCATION_GROWTH)
+                content = await self._with_retries(lambda timeout: self._hedged(prompt, temperature, larger, timeout))
+        except Exception:
+            record_request("error")
+            raise
+        record_request("ok")
+        await asyncio.to_thread(get_cache().save, key, self.model, prompt, content, cache)
+        return content
+
+    async def _with_retries(self, attempt_fn):
+        # `attempt_fn(timeout)` hace un intento; se repite con backoff mientras quede plazo total
+        deadline = time.monotonic() + LLM_DEADLINE
+        attempt = 0
+        while True:
+            timeout = min(LLM_TIMEOUT, deadline - time.monotonic())
+            try:
+                return await attempt_fn(timeout)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    e = LLMTimeoutError(f"Sin respuesta del LLM en {timeout:.1f} s")
+                delay = backoff_delay(attempt, e)
+                if attempt >= LLM_MAX_RETRIES or not is_retryable(e) or time.monotonic() + delay >= deadline:
+                    raise e
+            record_request("reintento")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _hedged(self, prompt: str, temperature: float, max_tokens: int, timeout: float,
+                      allow_truncated: bool = False) -> str:
+        # Si la llamada supera el p95 de su sección, lanza una copia y se queda con la primera respuesta.
+        # El plazo del intento y el umbral corren desde que hay cupo y cuota, como las muestras del p95:
+        # esperar al limitador no agota el intento ni lanza copias que también harían cola
+        section = current_section.get() or "otro"
+        threshold = self.latencies.p95(section) if LLM_HEDGE else None
+        session, semaphore = self._state()
+        waiting = time.perf_counter()
+        async with semaphore:
+            await self._wait_quota(prompt, max_tokens, waiting)
+            pending = {asyncio.ensure_future(self._send(session, prompt, temperature, max_tokens, allow_truncated))}
+            deadline = time.monotonic() + timeout
+            hedged = threshold is None or threshold >= timeout
+            error = None
+            try:
+                while pending:
+                    wait = (deadline - time.monotonic()) if hedged else threshold
+                    done, pending = await asyncio.wait(pending, timeout=max(0, wait), return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            return task.result()
+                        error = task.exception()
+                    if not done:
+                        if hedged:
+                            raise asyncio.TimeoutError()
+                        hedged = True
+                        record_request("duplicada")
+                        # La copia espera su propio cupo y cuota
+                        pending.add(asyncio.ensure_future(self._request(prompt, temperature, max_tokens, allow_truncated)))
+                raise error
+            finally:
+                for task in pending:
+                    task.cancel()
+
+    async def chat_stream(self, prompt: str, temperature: float = 0.65, max_tokens: int = 2000,
+                          cache: str = None, allow_truncated: bool = False):
+        # Igual que chat() pero entrega el texto por fragmentos según llegan los tokens. Si la respuesta
+        # se corta en max_tokens lanza LLMTruncatedError al final: el llamador decide si reintenta
+        key = cache_key(self.model, prompt, temperature, max_tokens)
+        cached = await asyncio.to_thread(get_cache().lookup, key, cache)
+        if cached is not None:
+            record_request("cache")
+            yield cached
+            return
+
+        parts = []
+        session, semaphore = self._state()
+        waiting = time.perf_counter()
+        async with semaphore:
+            # Solo se reintenta la apertura: una vez enviados fragmentos al cliente no hay vuelta atrás
+            try:
+                response = await self._with_retries(
+                    lambda timeout: self._open_stream(session, prompt, temperature, max_tokens, waiting, timeout))
+                chunks = response.__aiter__()
+                finish_reason = None
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), LLM_TIMEOUT)
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        raise LLMTimeoutError(f"El streaming del LLM se detuvo más de {LLM_TIMEOUT:.0f} s")
+                    finish_reason = chunk.choices[0].get("finish_reason") or finish_reason
+                    delta = chunk.choices[0].delta.get("content")
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+                if finish_reason == "length":
+                    record_request("truncada")
+                    if not allow_truncated:
+                        raise LLMTruncatedError(f"La respuesta se cortó en {max_tokens} tokens")
+            except Exception:
+                record_request("error")
+                raise
+        record_request("ok")
+        # En streaming no llega `usage`: cada fragmento es aproximadamente un token
+        record_tokens(count_tokens(prompt), len(parts))
+
+        content = "".join(parts).strip()
+        await asyncio.to_thread(get_cache().save, key, self.model, prompt, content, cache)
+
+    async def _open_stream(self, session, prompt: str, temperature: float, max_tokens: int, waiting: float,
+                           timeout: float):
+        # El plazo de apertura corre desde que hay cuota
+        await self._wait_quota(prompt, max_tokens, waiting)
+        openai = load_openai()
+        openai.aiosession.set(session)
+        return await asyncio.wait_for(openai.ChatCompletion.acreate(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        ), timeout)
+
+    async def _wait_quota(self, prompt: str, max_tokens: int, waiting: float):
+        # Espera por cuota RPM/TPM (el cupo de concurrencia ya está tomado) y registra la espera total
+        await self.limiter.acquire(estimate_tokens(prompt, max_tokens))
+        observe_stage("espera_llm", time.perf_counter() - waiting)
+
+    async def _request(self, prompt: str, temperature: float, max_tokens: int, allow_truncated: bool = False) -> str:
+        session, semaphore = self._state()
+        waiting = time.perf_counter()
+        async with semaphore:
+            await self._wait_quota(prompt, max_tokens, waiting)
+            return await self._send(session, prompt, temperature, max_tokens, allow_truncated)
+
+    async def _send(self, session, prompt: str, temperature: float, max_tokens: int, allow_truncated: bool = False) -> str:
+        # Una solicitud con cupo y cuota ya concedidos
+        # openai 0.28 usa la sesión aiohttp del contexto actual en vez de abrir una por llamada
+        openai = load_openai()
+        openai.aiosession.set(session)
+        sent = time.perf_counter()
+        response = await openai.ChatCompletion.acreate(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        self.latencies.add(current_section.get() or "otro", time.perf_counter() - sent)
+        usage = response.get("usage")
+        if usage:
+            record_tokens(usage["prompt_tokens"], usage["completion_tokens"])
+        if response.choices[0].get("finish_reason") == "length":
+            # La respuesta se cortó en max_tokens: el presupuesto de la sección se quedó corto
+            record_request("truncada")
+            if not allow_truncated:
+                raise LLMTruncatedError(f"La respuesta se cortó en {max_tokens} tokens")
+        return response.choices[0].message.content.strip()
+
+    async def warm_up(self):
+        # Importa openai y abre la sesión HTTP del event loop actual antes de la primera solicitud
+        await asyncio.to_thread(load_openai)
+        self._state()
+
+    async def aclose(self):
+        # Cierra la sesión del event loop actual
+        loop = asyncio.get_running_loop()
+        state = self._loops.pop(loop, None)
+        if state is not None and not state[0].closed:
+            await state[0].close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    # Cliente compartido por todo el proceso
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient()
+    return _client
@@ -1,14 +1,107 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from generator import generate_article
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
+from article_store import get_article_store
+from artifact_store import get_artifact_store
+from batch import build_zip, generate_batch, validate_entries
+from docx_writer import DOCX_MEDIA_TYPE, load_template
+from generator import (ARTICLE_BLOCKS, GENERATION_MODE, GENERATION_MODES, generate_article_async,
+                       regenerate_article_async, section_parts, sections_for, token_sink)
+from jobs import Job, JobQueue, QueueFullError
+from llm_cache import cache_policy, get_cache
+from llm_client import get_client
+from prompts import registry_info
+from metrics import ADMISSIONS, Gauge, current_trace, current_usage, render_latest
+import asyncio
+import json
+import math
 import os
+import weakref
 
-# Instalar versión correcta de OpenAI si es necesario
-os.system("pip install openai==0.28 --upgrade")
+article_locks = weakref.WeakValueDictionary()
+
+def article_lock(article_id):
+    # Un asyncio.Lock por artículo mientras algún trabajo lo use
+    lock = article_locks.get(article_id)
+    if lock is None:
+        lock = article_locks[article_id] = asyncio.Lock()
+    return lock
+
+async def run_job(job):
+    # La política de caché viaja por contextvar hasta cada llamada al LLM. Todas se fijan en cada
+    # trabajo (también a None): el worker ejecuta sus trabajos uno tras otro en el mismo contexto
+    cache_policy.set(job.cache)
+    current_trace.set(job.trace)
+    current_usage.set(job.usage)
+    token_sink.set(job.stream_token if job.events is not None else None)
+
+    if job.batch:
+        # Lote: un solo trabajo de la cola genera todos los artículos y los empaqueta en un ZIP
+        def on_item_done(index, error):
+            job.progress[f"articulo_{index:02d}"] = "error" if error else "listo"
+
+        results = await generate_batch(job.batch, on_item_done=on_item_done)
+        contenido = await asyncio.to_thread(build_zip, results)
+        return await asyncio.to_thread(get_artifact_store().put, contenido, "application/zip", "articulos_generados.zip")
+
+    # Generación y regeneraciones de un mismo artículo van de a una: el DOCX que queda enlazado
+    # al artículo corresponde siempre al último estado guardado
+    async with article_lock(job.article_id):
+        if job.blocks:
+            # Regeneración de bloques sueltos de un artículo ya guardado
+            docx = await regenerate_article_async(
+                job.article_id, job.blocks, on_section_done=lambda name, texto: job.section_done(name, {name: texto})
+            )
+        else:
+            def on_section_done(name, value):
+                job.section_done(name, section_parts(name, value))
+
+            docx = await generate_article_async(job.tema, job.nivel, job.pais, on_section_done=on_section_done,
+                                                mode=job.mode, article_id=job.article_id)
+
+        # El DOCX va al almacén de artefactos; el trabajo solo guarda su id (hash del contenido)
+        artifact_id = await asyncio.to_thread(get_artifact_store().put, docx, DOCX_MEDIA_TYPE, "articulo_generado.docx")
+        await asyncio.to_thread(get_article_store().update, job.article_id, artifact_id=artifact_id)
+        return artifact_id
+
+job_queue = JobQueue(run_job)
+
+Gauge("trabajos_en_cola", "Artículos esperando un trabajador",
+      function=lambda: {(): job_queue.queue.qsize() if job_queue.queue else 0})
+Gauge("trabajos_espera_estimada_segundos", "Espera estimada para un trabajo nuevo según su prioridad", ["prioridad"],
+      function=lambda: {(n,): job_queue.estimate_wait(p) for p, n in PRIORITY_NAMES.items()})
+Gauge("llm_cache_eventos", "Aciertos, fallos y escrituras de la caché del LLM desde el arranque", ["evento"],
+      function=lambda: {(k,): v for k, v in get_cache().stats.items()})
+
+# Estado de arranque para /health/ready
+readiness = {"listo": False, "error": None}
+
+async def warm_up():
+    # Importa openai/python-docx, prepara la plantilla DOCX, abre la caché, el almacén de artefactos y el pool HTTP
+    try:
+        await asyncio.to_thread(load_template)
+        await asyncio.to_thread(lambda: get_cache().store)
+        await asyncio.to_thread(get_artifact_store)
+        await get_client().warm_up()
+        readiness["listo"] = True
+    except Exception as e:
+        print(f"Error al preparar la API: {str(e)}")
+        readiness["error"] = str(e)
+
+@asynccontextmanager
+async def lifespan(app):
+    job_queue.start()
+    # El calentamiento corre en segundo plano: la API responde /health/live desde el inicio
+    warm_task = asyncio.create_task(warm_up())
+    yield
+    warm_task.cancel()
+    await job_queue.stop()
+    # Cierra el pool de conexiones HTTP hacia OpenAI
+    await get_client().aclose()
 
 # Forzar redeploy - sin impacto
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Desbloqueo total de CORS para pruebas (luego puedes restringir)
 app.add_middleware(
@@ -23,22 +116,344 @@ app.add_middleware(
 def root():
     return {"message": "API funcionando"}
 
+@app.get("/health/live")
+def liveness():
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+def readiness_check():
+    if not readiness["listo"]:
+        return JSONResponse(status_code=503, content={"status": "iniciando", "error": readiness["error"]})
+    return {"status": "ok"}
+
+# CONTROL DE ADMISIÓN: cuota de trabajos activos por cliente, prioridad y rechazo temprano
+# cuando la espera estimada por la profundidad de la cola supera el máximo aceptable
+
+# API keys de clientes de pago (separadas por comas): van primero y tienen una cuota mayor
+PRIORITY_API_KEYS = {k.strip() for k in os.getenv("PRIORITY_API_KEYS", "").split(",") if k.strip()}
+# Resto de API keys emitidas; una key desconocida no identifica al cliente (se usa su IP)
+CLIENT_API_KEYS = {k.strip() for k in os.getenv("CLIENT_API_KEYS", "").split(",") if k.strip()} | PRIORITY_API_KEYS
+# Proxies de confianza delante de la API (p. ej. 1 detrás del proxy de Railway). Con 0 se ignora
+# X-Forwarded-For, que el cliente puede escribir a su gusto. Si uvicorn ya aplica los encabezados
+# del proxy (--proxy-headers con --forwarded-allow-ips), request.client es el cliente: dejar 0
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+CLIENT_MAX_ACTIVE = int(os.getenv("CLIENT_MAX_ACTIVE", "3"))
+CLIENT_MAX_ACTIVE_PRIORITY = int(os.getenv("CLIENT_MAX_ACTIVE_PRIORITY", "10"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "180"))
+# 0 se atiende antes: pago, luego nivel Scopus y al final el resto (masivo)
+PRIORITY_NAMES = {0: "pago", 1: "scopus", 2: "masivo"}
+
+def ip_cliente(request):
+    # Cada proxy agrega a la derecha de X-Forwarded-For la IP que le habló: la entrada que añadió el
+    # primero de los TRUSTED_PROXY_HOPS de confianza es la del cliente; lo que está a su izquierda
+    # lo escribió el propio cliente y no se usa
+    directa = request.client.host if request.client else "desconocido"
+    if TRUSTED_PROXY_HOPS <= 0:
+        return directa
+    entradas = [e.strip() for e in request.headers.get("x-forwarded-for", "").split(",") if e.strip()]
+    if not entradas:
+        return directa
+    return entradas[max(0, len(entradas) - TRUSTED_PROXY_HOPS)]
+
+def identificar_cliente(request):
+    # Devuelve (id del cliente, es de pago). Solo una API key emitida identifica al cliente; si no, su IP
+    api_key = request.headers.get("x-api-key")
+    if api_key and api_key in CLIENT_API_KEYS:
+        return f"key:{api_key}", api_key in PRIORITY_API_KEYS
+    return f"ip:{ip_cliente(request)}", False
+
+def prioridad(pagado, nivel):
+    if pagado:
+        return 0
+    return 1 if (nivel or "").strip().lower() == "scopus" else 2
+
+def admitir(job, key=None, pagado=False):
+    # Devuelve (job, None) o (None, respuesta 429/503 con Retry-After)
+    nombre = PRIORITY_NAMES[job.priority]
+    # Unirse a un trabajo idéntico en vuelo no cuesta nada: no pasa por cuota ni estimación
+    if job_queue.find_inflight(key) is None:
+        limite = CLIENT_MAX_ACTIVE_PRIORITY if pagado else CLIENT_MAX_ACTIVE
+        if job_queue.active.get(job.client, 0) >= limite:
+            ADMISSIONS.inc(resultado="rechazada_cuota", prioridad=nombre)
+            return None, JSONResponse(
+                status_code=429,
+                content={"error": f"Ya tienes {limite} artículos en curso; espera a que termine alguno."},
+                headers={"Retry-After": str(max(1, math.ceil(job_queue.avg_seconds / 2)))}
+            )
+        espera = job_queue.estimate_wait(job.priority)
+        if espera > ADMISSION_MAX_WAIT:
+            ADMISSIONS.inc(resultado="rechazada_espera", prioridad=nombre)
+            return None, JSONResponse(
+                status_code=503,
+                content={"error": "El servicio está saturado, inténtalo más tarde.", "estimated_wait_s": round(espera, 1)},
+                headers={"Retry-After": str(max(1, math.ceil(espera - ADMISSION_MAX_WAIT)))}
+            )
+        job.estimated_wait = espera
+
+    try:
+        admitido = job_queue.submit(job, key=key)
+    except QueueFullError as e:
+        ADMISSIONS.inc(resultado="rechazada_cola", prioridad=nombre)
+        retry = max(1, math.ceil(job_queue.avg_seconds / job_queue.workers))
+        return None, JSONResponse(status_code=503, content={"error": str(e)}, headers={"Retry-After": str(retry)})
+    ADMISSIONS.inc(resultado="agrupada" if admitido is not job else "aceptada", prioridad=nombre)
+    return admitido, None
+
+def encolar(data, request, stream=False):
+    # Devuelve (job, None) o (None, respuesta de error)
+    tema = data.get("tema")
+    nivel = data.get("nivel", "Scopus")
+    pais = data.get("pais", "Perú")
+    cache = data.get("cache")  # "bypass" o "refresh" para ignorar respuestas guardadas
+    trace = bool(data.get("trace", False))  # guarda la traza JSON por etapas del artículo
+    modo = data.get("modo", GENERATION_MODE)  # "json" pide secciones estructuradas en menos llamadas
+    fresh = bool(data.get("fresh", False))  # variante nueva: no se une a otra solicitud ni lee la caché
+    if cache not in (None, "bypass", "refresh"):
+        return None, JSONResponse(status_code=400, content={"error": "cache debe ser 'bypass' o 'refresh'"})
+    if modo not in GENERATION_MODES:
+        return None, JSONResponse(status_code=400, content={"error": f"modo debe ser uno de {list(GENERATION_MODES)}"})
+    if fresh and cache is None:
+        cache = "refresh"
+
+    # Solicitudes idénticas en vuelo comparten un solo trabajo, salvo que pidan streaming,
+    # traza propia o ignorar la caché
+    key = None if (stream or trace or cache) else (tema, nivel, pais, modo)
+
+    client, pagado = identificar_cliente(request)
+    sections = [s.name for s in sections_for(modo)]
+    job = Job(tema, nivel, pais, sections, cache=cache, stream=stream, trace=trace, mode=modo,
+              client=client, priority=prioridad(pagado, nivel))
+    return admitir(job, key=key, pagado=pagado)
+
 @app.post("/generar")
 async def generar_articulo(request: Request):
     data = await request.json()
     print("Datos recibidos:", data)
 
-    tema = data.get("tema")
-    nivel = data.get("nivel", "Scopus")
-    pais = data.get("pais", "Perú")
+    # Encola el trabajo y responde de inmediato con su id
+    job, error = encolar(data, request)
+    if error is not None:
+        return error
+
+    return JSONResponse(status_code=202, content={
+        "job_id": job.id,
+        "article_id": job.article_id,
+        "status": job.status,
+        "coalesced": job.coalesced > 0,
+        "estimated_wait_s": round(job.estimated_wait or 0, 1),
+        "estimated_latency_s": round((job.estimated_wait or 0) + job_queue.avg_seconds, 1),
+        "status_url": f"/generar/{job.id}",
+        "download_url": f"/generar/{job.id}/descargar"
+    })
+
+@app.post("/generar/stream")
+async def generar_articulo_stream(request: Request):
+    data = await request.json()
+    print("Datos recibidos (stream):", data)
+
+    job, error = encolar(data, request, stream=True)
+    if error is not None:
+        return error
+
+    async def eventos():
+        yield f"event: job\ndata: {json.dumps({'job_id': job.id}, ensure_ascii=False)}\n\n"
+        while True:
+            event, payload = await job.events.get()
+            yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            if event in ("done", "error"):
+                break
+
+    return StreamingResponse(eventos(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/generar/batch")
+async def generar_lote(request: Request):
+    data = await request.json()
+    entradas = data.get("articulos", []) if isinstance(data, dict) else data
+    try:
+        entries = validate_entries(entradas)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    print(f"Lote recibido: {len(entries)} artículos")
+
+    # El lote ocupa un solo trabajador de la cola acotada y, como trabajo masivo, va detrás de los
+    # de pago y Scopus; pasa por la misma cuota por cliente y estimación de espera. El ZIP se
+    # descarga al terminar
+    client, pagado = identificar_cliente(request)
+    job = Job(None, None, None, [f"articulo_{i:02d}" for i in range(1, len(entries) + 1)], batch=entries,
+              client=client, priority=2)
+    job, error = admitir(job, pagado=pagado)
+    if error is not None:
+        return error
+
+    return JSONResponse(status_code=202, content={
+        "job_id": job.id,
+        "status": job.status,
+        "articulos": len(entries),
+        "estimated_wait_s": round(job.estimated_wait or 0, 1),
+        "status_url": f"/generar/{job.id}",
+        "download_url": f"/generar/{job.id}/descargar"
+    })
 
+@app.get("/generar/{job_id}")
+def estado_articulo(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Trabajo no encontrado"})
+    return job.to_dict()
+
+@app.get("/generar/{job_id}/descargar")
+async def descargar_articulo(job_id: str, request: Request):
+    job = job_queue.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Trabajo no encontrado"})
+    if job.status != "completado":
+        return JSONResponse(status_code=409, content={"error": f"El artículo aún no está listo ({job.status})"})
+    return await servir_artefacto(job.result, request)
+
+@app.get("/artefactos/{artifact_id}")
+async def descargar_artefacto(artifact_id: str, request: Request):
+    # Descarga directa por hash; sigue disponible aunque el trabajo ya se haya olvidado
+    return await servir_artefacto(artifact_id, request)
+
+def rango_solicitado(header, size):
+    # Un solo rango "bytes=inicio-fin" o "bytes=-n"; cualquier otra forma se ignora y se sirve entero.
+    # Lanza ValueError si el rango no se puede satisfacer.
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes="):].strip().partition("-")
     try:
-        ruta_archivo = generate_article(tema, nivel, pais)
-        return FileResponse(
-            ruta_archivo,
-            filename="articulo_generado.docx",
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        )
-    except Exception as e:
-        print(f"Error: {str(e)}")
-        return {"error": str(e)}
+        if start == "":
+            length = int(end)
+            if length <= 0:
+                raise ValueError
+            return max(0, size - length), size - 1
+        start, end = int(start), int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise ValueError("Rango fuera del archivo")
+    return start, min(end, size - 1)
+
+def leer_archivo(path, start, length, chunk=64 * 1024):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(chunk, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+async def servir_artefacto(artifact_id, request):
+    artifact = await asyncio.to_thread(get_artifact_store().get, artifact_id)
+    if artifact is None:
+        return JSONResponse(status_code=404, content={"error": "Documento no encontrado o ya expulsado del almacén"})
+
+    size = artifact["size"]
+    etag = f'"{artifact_id}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # El id es el hash del contenido: la misma URL nunca cambia de bytes
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Content-Disposition": f'attachment; filename="{artifact["filename"]}"',
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    status, start, end = 200, 0, size - 1
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range == etag:
+        try:
+            rango = rango_solicitado(request.headers.get("range"), size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if rango is not None:
+            status, (start, end) = 206, rango
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        leer_archivo(artifact["path"], start, end - start + 1),
+        status_code=status,
+        media_type=artifact["media_type"],
+        headers=headers
+    )
+
+@app.get("/generar/{job_id}/traza")
+def traza_articulo(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Trabajo no encontrado"})
+    if job.trace is None:
+        return JSONResponse(status_code=404, content={"error": "Este trabajo se creó sin traza (usa \"trace\": true)"})
+    return {"job_id": job.id, "status": job.status, "spans": job.trace}
+
+@app.get("/articulos/{article_id}")
+async def estado_guardado(article_id: str):
+    state = await asyncio.to_thread(get_article_store().load, article_id)
+    if state is None:
+        return JSONResponse(status_code=404, content={"error": "Artículo no encontrado"})
+    return {
+        "article_id": article_id,
+        "titulo": state["titulo"],
+        "tema": state["tema"],
+        "nivel": state["nivel"],
+        "pais": state["pais"],
+        "modo": state.get("modo"),
+        "bloques": state["generated_text"],
+        "referencias": state["reference_list"],
+        "download_url": f"/artefactos/{state['artifact_id']}" if state.get("artifact_id") else None,
+        "created_at": state["created_at"],
+        "updated_at": state["updated_at"],
+    }
+
+@app.post("/articulos/{article_id}/regenerar")
+async def regenerar_secciones(article_id: str, request: Request):
+    # Vuelve a generar solo los bloques indicados y re-renderiza el DOCX con el resto intacto
+    data = await request.json()
+    secciones = data.get("secciones") or []
+    if isinstance(secciones, str):
+        secciones = [secciones]
+    secciones = list(dict.fromkeys(secciones))
+    if not secciones or any(s not in ARTICLE_BLOCKS for s in secciones):
+        return JSONResponse(status_code=400, content={"error": f"secciones debe ser una lista con elementos de {ARTICLE_BLOCKS}"})
+
+    state = await asyncio.to_thread(get_article_store().load, article_id)
+    if state is None:
+        return JSONResponse(status_code=404, content={"error": "Artículo no encontrado"})
+
+    # "refresh": leer la caché devolvería el mismo texto que se quiere reemplazar
+    client, pagado = identificar_cliente(request)
+    job = Job(state["tema"], state["nivel"], state["pais"], secciones, cache="refresh",
+              trace=bool(data.get("trace", False)), mode=state.get("modo"), article_id=article_id, blocks=secciones,
+              client=client, priority=prioridad(pagado, state["nivel"]))
+    job, error = admitir(job, pagado=pagado)
+    if error is not None:
+        return error
+
+    return JSONResponse(status_code=202, content={
+        "job_id": job.id,
+        "article_id": article_id,
+        "status": job.status,
+        "estimated_wait_s": round(job.estimated_wait or 0, 1),
+        "status_url": f"/generar/{job.id}",
+        "download_url": f"/generar/{job.id}/descargar"
+    })
+
+@app.get("/metrics")
+def metricas():
+    return PlainTextResponse(render_latest(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache")
+def estado_cache():
+    return get_cache().get_stats()
+
+@app.get("/prompts")
+def plantillas():
+    # Plantillas registradas con sus tokens fijos y el max_tokens de cada sección
+    return registry_info()
+
+@app.get("/artefactos")
+def estado_artefactos():
+    return get_artifact_store().get_stats()
@@ -0,0 +1,194 @@
+# metrics.py
+#
+# Métricas en formato de texto de Prometheus (histogramas y contadores con etiquetas)
+# y trazas JSON opcionales por artículo, sin dependencias externas.
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Lista de spans del artículo en curso (None si no se está trazando)
+current_trace: contextvars.ContextVar[Optional[List[Dict[str, object]]]] = contextvars.ContextVar("current_trace", default=None)
+# Sección que está pidiendo al LLM, para etiquetar los tokens consumidos
+current_section: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_section", default=None)
+# Tokens del artículo en curso por sección: {seccion: {"prompt": n, "completion": n, "llamadas": n}}
+current_usage: contextvars.ContextVar[Optional[Dict[str, Dict[str, int]]]] = contextvars.ContextVar("current_usage", default=None)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: Dict[str, str] = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = super().render()
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        # Si se da `function`, se consulta al exponer: devuelve {tupla de etiquetas: valor}
+        self.function = function
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def render(self):
+        lines = super().render()
+        values = self.function() if self.function else dict(self.values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values: Dict[Tuple[str, ...], List[float]] = {}  # [conteos por bucket..., suma, total]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            data = self.values.get(key)
+            if data is None:
+                data = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def render(self):
+        lines = super().render()
+        with self.lock:
+            for key, data in sorted(self.values.items()):
+                for i, bound in enumerate(self.buckets):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': bound})} {data[i]}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': '+Inf'})} {data[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {data[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {data[-1]}")
+        return lines
+
+
+# MÉTRICAS DEL PIPELINE
+
+STAGE_SECONDS = Histogram("articulo_etapa_segundos", "Duración de cada etapa del pipeline", ["etapa"])
+LLM_CALL_SECONDS = Histogram("llm_llamada_segundos", "Duración de cada llamada al LLM por sección", ["seccion"])
+LLM_REQUESTS = Counter("llm_solicitudes_total", "Llamadas al LLM por resultado", ["seccion", "resultado"])
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens consumidos según la respuesta de OpenAI", ["seccion", "tipo"])
+JOB_QUEUE_WAIT = Histogram("trabajo_espera_cola_segundos", "Tiempo en cola antes de empezar a generar")
+JOB_SECONDS = Histogram("trabajo_total_segundos", "Duración de la generación de un artículo", ["estado"])
+JOBS = Counter("trabajos_total", "Artículos procesados por estado", ["estado"])
+ADMISSIONS = Counter("admision_total", "Decisiones del control de admisión de /generar", ["resultado", "prioridad"])
+COALESCED = Counter("solicitudes_agrupadas_total", "Solicitudes idénticas atendidas por una ejecución ya en vuelo", ["capa"])
+
+
+@contextmanager
+def span(stage: str, histogram: Histogram = None, **labels):
+    """
+    Mide un bloque y lo registra en `histogram` (por defecto, STAGE_SECONDS con etiqueta etapa)
+    y, si hay traza activa, también como span.
+    """
+    start = time.perf_counter()
+    started_at = time.time()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        if histogram is None:
+            STAGE_SECONDS.observe(duration, etapa=stage)
+        else:
+            histogram.observe(duration, **labels)
+        trace = current_trace.get()
+        if trace is not None:
+            entry = {"span": stage, "inicio": started_at, "duracion": duration, **labels}
+            if error:
+                entry["error"] = error
+            trace.append(entry)
+
+
+def observe_stage(stage: str, seconds: float):
+    # Para tiempos medidos a mano donde un `with span(...)` no encaja
+    STAGE_SECONDS.observe(seconds, etapa=stage)
+
+
+def record_request(outcome: str):
+    LLM_REQUESTS.inc(seccion=current_section.get() or "otro", resultado=outcome)
+
+
+def record_tokens(prompt_tokens: int, completion_tokens: int):
+    section = current_section.get() or "otro"
+    LLM_TOKENS.inc(prompt_tokens, seccion=section, tipo="prompt")
+    LLM_TOKENS.inc(completion_tokens, seccion=section, tipo="completion")
+    usage = current_usage.get()
+    if usage is not None:
+        totals = usage.setdefault(section, {"prompt": 0, "completion": 0, "llamadas": 0})
+        totals["prompt"] += prompt_tokens
+        totals["completion"] += completion_tokens
+        totals["llamadas"] += 1
+    trace = current_trace.get()
+    if trace is not None:
+        trace.append({"span": "tokens", "seccion": section, "prompt": prompt_tokens, "completion": completion_tokens})
+
+
+def render_latest() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,141 @@
+# prompts.py
+#
+# Registro de plantillas de prompt por sección. Cada plantilla se analiza una sola vez al
+# registrarla, se cuentan sus tokens fijos sin llamar a la API y lleva su propio presupuesto
+# de max_tokens según la longitud que se pide (un título no necesita 2000 tokens).
+
+import os
+import string
+from typing import Dict, Optional
+
+from llm_client import count_tokens
+
+# Tokens por palabra en español (cl100k ronda 1.6-2) y holgura sobre la longitud pedida,
+# porque el modelo suele pasarse del número de palabras indicado
+TOKENS_PER_WORD = float(os.getenv("TOKENS_PER_WORD", "2.0"))
+MAX_TOKENS_MARGIN = float(os.getenv("MAX_TOKENS_MARGIN", "1.5"))
+DEFAULT_MAX_TOKENS = 2000
+
+def budget_for_words(words: int) -> int:
+    return int(words * TOKENS_PER_WORD * MAX_TOKENS_MARGIN)
+
+
+class PromptTemplate:
+    """
+    Plantilla `str.format` con los campos de `r` (tema, titulo, pais...). Los campos se validan al
+    registrarla; `words` es la longitud objetivo de la respuesta y fija su max_tokens.
+    """
+
+    def __init__(self, name: str, template: str, words: int, min_tokens: int = 0):
+        self.name = name
+        self.template = template
+        self.words = words
+        self.fields = tuple(dict.fromkeys(f for _, f, _, _ in string.Formatter().parse(template) if f))
+        self.max_tokens = max(min_tokens, budget_for_words(words))
+        self._static_tokens = None
+
+    @property
+    def static_tokens(self) -> int:
+        # Tokens del texto fijo de la plantilla (sin los campos), contados una vez en el primer uso
+        if self._static_tokens is None:
+            self._static_tokens = count_tokens(self.template.format_map({f: "" for f in self.fields}))
+        return self._static_tokens
+
+    def render(self, values: Dict[str, object]) -> str:
+        return self.template.format_map({f: values[f] for f in self.fields})
+
+    def info(self) -> Dict[str, object]:
+        return {"campos": list(self.fields), "palabras": self.words, "tokens_fijos": self.static_tokens,
+                "max_tokens": self.max_tokens}
+
+
+_registry: Dict[str, PromptTemplate] = {}
+
+
+def register(name: str, template: str, words: int, min_tokens: int = 0) -> PromptTemplate:
+    if name in _registry:
+        raise ValueError(f"Plantilla repetida: {name}")
+    _registry[name] = PromptTemplate(name, template, words, min_tokens)
+    return _registry[name]
+
+
+def render_prompt(name: str, values: Dict[str, object]) -> str:
+    return _registry[name].render(values)
+
+
+def max_tokens_for(name: Optional[str]) -> int:
+    template = _registry.get(name)
+    return template.max_tokens if template is not None else DEFAULT_MAX_TOKENS
+
+
+def registry_info() -> Dict[str, Dict[str, object]]:
+    return {name: template.info() for name, template in _registry.items()}
+
+
+# PÁRRAFOS MODELO (se envían tal cual en cada llamada de su sección; su coste aparece en tokens_fijos)
+
+MODELO_CONTEXTO = "Los polifenoles han demostrado tener un impacto positivo en la reducción de los niveles lipídicos en estudios con Rattus. Se ha encontrado que la administración de diversos extractos de plantas, frutas y otras fuentes naturales en ratas y ratones, que contienen altos niveles de polifenoles contribuyen a disminuir significativamente los niveles de colesterol, triglicéridos y lipoproteínas en ratas y ratones, con reducciones que oscilan entre el 15% y el 30% en comparación con grupos de control. Es así que un producto que también tiene estas características es el Rubus spp. que contiene antioxidantes y compuestos fenólicos que por sus propiedades bioactivas también pueden contribuir a la mejora del perfil lipídico, lo que revela un potencial efecto hipolipemiante. Su potencial la convierte en un candidato interesante para futuros estudios en el ámbito de la nutrición y la salud. Además, su fácil acceso y bajo costo pueden facilitar su incorporación en la dieta de diversas poblaciones. Por lo tanto, es esencial seguir investigando los efectos de la moral en la salud cardiovascular y su uso en estrategias de prevención. Por lo que, la mora Rubus spp. representa una opción viable y beneficiosa en el manejo de la hiperlipidemia en ratas."
+
+MODELO_PROBLEMA = "En ese sentido, se parte de la premisa que la administración de mora Rubus spp. en Rattus resulta en una reducción significativa de los niveles de lípidos en sangre (tratamiento de la hiperlipidemia). Se espera que los compuestos bioactivos presentes en Rubus spp., como polifenoles y antocianinas, contribuyan a mejorar el perfil lipídico y a mitigar los efectos adversos asociados con este trastorno metabólico. Por lo tanto, los experimentos en vivo constituyen una oportunidad para validar la eficacia de Rubus spp. como un enfoque natural en la prevención y manejo de la hiperlipidemia."
+
+# PLANTILLAS POR SECCIÓN
+
+register(
+    "conceptos_clave",
+    "Del siguiente título académico: {titulo}, extrae dos conceptos principales: uno técnico desde la profesión del usuario y otro contextual desde el entorno o sector involucrado. "
+    "Devuélvelos sin comillas, en minúsculas, sin numeración, separados por salto de línea.",
+    words=10, min_tokens=50
+)
+
+register(
+    "titulo",
+    (
+        "A partir del siguiente input informal: '{tema}', genera un título académico formal con redacción Scopus. "
+        "Debe contener una combinación entre un concepto técnico derivado de la carrera y otro del entorno. "
+        "No repitas frases del input, no uses comillas ni fórmulas genéricas como 'un estudio sobre' o 'intersección entre'."
+    ),
+    words=25, min_tokens=80
+)
+
+register(
+    "contexto",
+    "Redacta un texto así sobre la problemática del artículo titulado '{titulo}', mismo tamaño, mismo 1 párrafo, recuerda, sin usar datos cuantitativos, NO MENCIONES EL TITULO DE LA INVESTIGACION. HAZLO COMO ESTE MODELO: " + MODELO_CONTEXTO,
+    words=170
+)
+
+register(
+    "mundial_latam_peru",
+    (
+        "Redacta un texto de 3 párrafos, c/u de 100 palabras, todo estilo scopus q1, sobre la problemática del artículo titulado '{titulo}'. "
+        "Cada párrafo es por un nivel: el primer párrafo nivel global o mundial, segundo nivel LATAM, tercero nivel nacional del país {pais}. "
+        "Cada párrafo debe tener 3 datos cuantitativos (solo uno porcentual, los otros 2 numericos, IMPORTANTEeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeee). "
+        "No incluyas citas ni menciones a instituciones (IMPORTANTISIMO) ni ambigüedades como 'cerca de' o 'casi'. No uses conectores de cierre. "
+        "Cada párrafo debe iniciar mencionando el nivel (ejemplo: A nivel global, En Latinoamérica, En el contexto de {pais}). "
+        "Además, cada párrafo debe tener 2 datos cualitativos. TODA SOLO INFORMACION DE LOS ULTIMOS 5 AÑOS. importante, no uses la palabra \"CUALITATIVA\" ni similares"
+    ),
+    words=300
+)
+
+register(
+    "problema",
+    "Redáctame un párrafo como este sobre problema, causas y consecuencias sobre la problemática del artículo titulado '{titulo}', en 90 palabras, redactado como para scopus q1, sin datos cuantitativos, sin citas, sin tanta puntuación o separación en las oraciones, que sea un párrafo fluido. no menciones el titulo del articulo textualmente en este parrafo, Modelo: " + MODELO_PROBLEMA,
+    words=90
+)
+
+register(
+    "justificacion",
+    "Redacta un párrafo de justificación, por relevancia, importancia, etc. (no lo hagas por niveles tipo tesis teórica, práctica o metodológica), de 100 palabras, estilo scopus q1, que empiece con la primera oración con preámbulo que contenga \"se justifica\", para el artículo titulado '{titulo}'. Sin mencionar el título del artículo en esta justificación.",
+    words=100
+)
+
+register(
+    "teorias",
+    "A partir de esta investigación titulada '{titulo}', busca 2 teorías en las que se podría basar, y de ellas, de cada una, redacta un párrafo de 150 palabras que tenga en la primera oración una especie de preámbulo, y a partir de la segunda ya menciones el nombre de la teoría, el padre (principal propulsor) y de qué trata. Importante: no menciones el título de la investigación en ningún párrafo ni uses conectores de cierre. Sin subtítulos, todo prosa. NO MENCIONES LIBROS. NO USES AMBIGUEDADES COMO, PODRIA SER, TODO EXACTO, EN VEZ DE PORDRIA SER, PON, ES. NO USES LAS PALABRAS, POR EJEMPLO, CRUCIAL",
+    words=300
+)
+
+register(
+    "conceptos",
+    "A partir de esta investigación titulada '{titulo}', extrae sus dos variables principales (generales, sin especificación). Luego, de cada una redacta un texto de dos párrafos (IMPORTANTE en total 4 PARRAFOS), cada párrafo de 100 palabras. IMPORTANTE: Cada párrafo debe comenzar con un CONECTOR DE ADICION (EJEMPLOS: de manera concordante, en consonancia con lo anterior, siguiendo esa orientación) ESTO ES IMPORTANTISIMOOOOO, y a partir de la segunda desarrollar definición, características, tipos, conceptos, etc. Ambos textos deben ir en prosa continua, sin subtítulos, IMPORTANTE: NO EXPLIQUES QUE HAS ESCOGIDO LAS VARIABLES, NO UTILICES LA PALABRA VARIABLE NI SIMILARES, NO MENCIONAR EL TITULO DE LA INVESTIGACION, NO HABLES EN PRIMERA PERSONA (EJ: HABLAMOS) IMPORTANTEEEEEEEEEEEEEEEEEEEEEEE. NO USES CONECTORES DE CIERRE. LEE TODAS LAS INIDCACIONES.",
+    words=400
+)
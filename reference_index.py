@@ -0,0 +1,230 @@
+# reference_index.py
+#
+# Índice local de referencias bibliográficas (SQLite FTS5, ranking BM25).
+# Se llena una vez desde un volcado JSONL y luego se consulta sin red:
+#
+#     python reference_index.py importar referencias.jsonl
+#     python reference_index.py buscar "calidad del agua"
+#
+# Cada línea del JSONL es un registro como:
+#     {"authors": ["Smith, J.", "Lopez, M."], "year": 2023, "title": "...", "venue": "...",
+#      "doi": "10.1234/abc", "type": "cientifico", "keywords": ["agua", "calidad"]}
+# `type` es "cientifico" (por defecto) o "institucional" (OMS, UNESCO, etc.).
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+REFERENCE_INDEX_PATH = os.getenv("REFERENCE_INDEX_PATH", "referencias.sqlite3")
+
+# Palabras que aparecen en las etiquetas del índice de CitationGenerator (título y términos de
+# cada bloque) y no aportan a la búsqueda: conectores, verbos de relleno y palabras vacías
+STOPWORDS = {
+    "problematica", "teoria", "teoría", "variable", "de", "del", "la", "las", "el", "los", "lo", "en",
+    "y", "e", "o", "u", "un", "una", "unos", "unas", "para", "por", "con", "sin", "sobre", "entre",
+    "su", "sus", "al", "que", "como", "cómo", "este", "esta", "esto", "estos", "estas", "ese", "esa",
+    "esos", "esas", "aquel", "según", "segun", "se", "es", "son", "ser", "sido", "está", "están", "fue",
+    "han", "ha", "hay", "más", "mas", "muy", "también", "tambien", "así", "asi", "cual", "cuales",
+    "cuyo", "cuya", "donde", "desde", "hacia", "hasta", "través", "traves", "cada", "todo", "toda",
+    "todos", "todas", "otro", "otra", "otros", "otras", "mismo", "misma", "manera", "forma", "modo",
+    "medida", "sentido", "parte", "tanto", "dicho", "dicha", "dichos", "dichas", "cuanto", "respecto",
+    "mediante", "ante", "tras", "durante", "aunque", "sino", "pero", "además", "ademas", "asimismo",
+    "concordante", "consonancia", "anterior", "orientación", "orientacion", "siguiendo", "propuesta",
+    "propuesto", "propone", "sostiene", "plantea", "planteada", "define", "definida", "refiere",
+    "establece", "señala", "indica", "permite", "resulta", "pertinente", "importante", "fundamental",
+    "estudio", "estudios", "investigación", "investigacion", "análisis", "analisis", "entiende",
+    "entendida", "considera", "considerada", "desarrollada", "desarrollado", "principal", "principales",
+    "the", "of", "and", "in", "on", "for", "to", "a", "an",
+}
+
+_conn = None
+_conn_lock = threading.Lock()
+
+
+def _connect(path: str = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(path or REFERENCE_INDEX_PATH, check_same_thread=False)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS referencias ("
+        "id INTEGER PRIMARY KEY, authors TEXT, year INTEGER, title TEXT, venue TEXT, "
+        "doi TEXT UNIQUE, source_type TEXT, keywords TEXT)"
+    )
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS referencias_fts USING fts5("
+        "title, keywords, venue, content='referencias', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')"
+    )
+    return conn
+
+
+def _get_conn() -> Optional[sqlite3.Connection]:
+    # Sin archivo de índice no hay corpus: no se crea uno vacío al consultar
+    global _conn
+    if _conn is None:
+        with _conn_lock:
+            if _conn is None:
+                if not os.path.exists(REFERENCE_INDEX_PATH):
+                    return None
+                _conn = _connect()
+    return _conn
+
+
+def import_jsonl(lines: Iterable[str], path: str = None) -> int:
+    """Importa registros JSONL al índice (ignora DOIs repetidos). Devuelve cuántos se añadieron."""
+    conn = _connect(path)
+    rows = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        authors = record.get("authors") or []
+        if isinstance(authors, str):
+            authors = [authors]
+        keywords = record.get("keywords") or []
+        if isinstance(keywords, list):
+            keywords = " ".join(keywords)
+        rows.append((
+            json.dumps(authors, ensure_ascii=False),
+            record.get("year"),
+            record.get("title", ""),
+            record.get("venue", ""),
+            record.get("doi") or None,
+            record.get("type", "cientifico"),
+            keywords,
+        ))
+
+    with conn:
+        before = conn.execute("SELECT COUNT(*) FROM referencias").fetchone()[0]
+        conn.executemany(
+            "INSERT OR IGNORE INTO referencias (authors, year, title, venue, doi, source_type, keywords) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        # Reconstruir el índice FTS de una vez es más rápido que fila por fila
+        conn.execute("INSERT INTO referencias_fts(referencias_fts) VALUES ('rebuild')")
+        after = conn.execute("SELECT COUNT(*) FROM referencias").fetchone()[0]
+    conn.close()
+
+    reset()
+    return after - before
+
+
+def reset():
+    # Cierra la conexión compartida y vacía la caché por etiqueta (tras importar)
+    global _conn
+    with _conn_lock:
+        if _conn is not None:
+            _conn.close()
+        _conn = None
+    _search.cache_clear()
+
+
+def search_terms(label: str) -> List[str]:
+    # Términos útiles de una etiqueta, sin repetir y en orden de aparición
+    terms = [t for t in re.findall(r"\w+", label.lower()) if len(t) > 2 and not t.isdigit() and t not in STOPWORDS]
+    return list(dict.fromkeys(terms))
+
+
+def key_terms(text: str, limit: int = 5) -> List[str]:
+    """
+    Términos más repetidos de un texto (sin palabras vacías), los más frecuentes primero y, a igual
+    frecuencia, en orden de aparición. Sirve para nombrar de qué trata un bloque sin depender de su
+    redacción.
+    """
+    counts: Dict[str, int] = {}
+    for term in re.findall(r"\w+", text.lower()):
+        if len(term) > 3 and not term.isdigit() and term not in STOPWORDS:
+            counts[term] = counts.get(term, 0) + 1
+    ranked = sorted(counts, key=lambda t: -counts[t])  # sorted es estable: conserva el orden de aparición
+    return ranked[:limit]
+
+
+def _match_query(label: str) -> Optional[str]:
+    terms = search_terms(label)
+    if not terms:
+        return None
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+def _row_to_record(row) -> Dict[str, object]:
+    authors, year, title, venue, doi, source_type = row
+    return {
+        "authors": json.loads(authors) if authors else [],
+        "year": year,
+        "title": title,
+        "venue": venue,
+        "doi": doi,
+        "type": source_type,
+    }
+
+
+def _index_version() -> Optional[int]:
+    # Cambia cuando otro proceso importa registros: invalida la caché de búsquedas de este proceso
+    try:
+        return os.stat(REFERENCE_INDEX_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def search(label: str, source_type: str = "cientifico", limit: int = 3) -> tuple:
+    """
+    Busca en el índice las referencias más relevantes (BM25) para una etiqueta.
+    Devuelve una tupla de registros; vacía si no hay índice o coincidencias.
+    """
+    return _search(label, source_type, limit, _index_version())
+
+
+@lru_cache(maxsize=4096)
+def _search(label: str, source_type: str, limit: int, version: Optional[int]) -> tuple:
+    # `version` solo forma parte de la clave de la caché
+    if version is None:
+        return ()
+    conn = _get_conn()
+    query = _match_query(label)
+    if conn is None or query is None:
+        return ()
+
+    with _conn_lock:
+        rows = conn.execute(
+            "SELECT r.authors, r.year, r.title, r.venue, r.doi, r.source_type "
+            "FROM referencias_fts JOIN referencias r ON r.id = referencias_fts.rowid "
+            "WHERE referencias_fts MATCH ? AND r.source_type = ? "
+            "ORDER BY bm25(referencias_fts) LIMIT ?",
+            (query, source_type, limit)
+        ).fetchall()
+    return tuple(_row_to_record(row) for row in rows)
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Índice local de referencias bibliográficas")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    importar = sub.add_parser("importar", help="Importa un volcado JSONL de registros")
+    importar.add_argument("archivo", help="Ruta al JSONL ('-' para stdin)")
+
+    buscar = sub.add_parser("buscar", help="Consulta el índice")
+    buscar.add_argument("etiqueta")
+    buscar.add_argument("--tipo", default="cientifico", choices=["cientifico", "institucional"])
+    buscar.add_argument("--limite", type=int, default=3)
+
+    args = parser.parse_args(argv)
+    if args.comando == "importar":
+        if args.archivo == "-":
+            added = import_jsonl(sys.stdin)
+        else:
+            with open(args.archivo, encoding="utf-8") as f:
+                added = import_jsonl(f)
+        print(f"{added} referencias nuevas en {REFERENCE_INDEX_PATH}")
+    else:
+        for record in search(args.etiqueta, args.tipo, args.limite):
+            print(json.dumps(record, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# section_graph.py
+
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+# Máximo de secciones generándose a la vez (se puede ajustar por variable de entorno)
+MAX_PARALLEL_SECTIONS = int(os.getenv("MAX_PARALLEL_SECTIONS", "6"))
+
+
+class Section:
+    """
+    Una sección del artículo: un nombre, la función que la genera y las secciones de las que depende.
+    `run` recibe el diccionario de resultados ya disponibles y puede ser síncrona o async.
+    """
+
+    def __init__(self, name: str, run: Callable[[Dict[str, object]], object], depends_on: Iterable[str] = ()):
+        self.name = name
+        self.run = run
+        self.depends_on = tuple(depends_on)
+
+    def __repr__(self):
+        return f"Section({self.name!r}, depends_on={list(self.depends_on)!r})"
+
+
+class SectionError(Exception):
+    """Fallo tipado de una sección: se propaga en vez de entregar texto de error como contenido."""
+
+    def __init__(self, section: str, cause: BaseException):
+        super().__init__(f"La sección '{section}' falló: {type(cause).__name__}: {cause}")
+        self.section = section
+        self.cause = cause
+
+
+def _validate(sections: List[Section], known: Iterable[str]):
+    names = [s.name for s in sections]
+    if len(names) != len(set(names)):
+        raise ValueError("Hay secciones con nombre repetido en el grafo.")
+
+    available = set(known) | set(names)
+    for section in sections:
+        missing = [d for d in section.depends_on if d not in available]
+        if missing:
+            raise ValueError(f"La sección '{section.name}' depende de secciones inexistentes: {missing}")
+
+    # Detecta ciclos resolviendo el orden topológico sin ejecutar nada
+    resolved = set(known)
+    remaining = list(sections)
+    while remaining:
+        ready = [s for s in remaining if all(d in resolved for d in s.depends_on)]
+        if not ready:
+            raise ValueError(f"Dependencias circulares entre: {[s.name for s in remaining]}")
+        resolved.update(s.name for s in ready)
+        remaining = [s for s in remaining if s not in ready]
+
+
+async def _run_one(section: Section, results: Dict[str, object], semaphore: asyncio.Semaphore):
+    async with semaphore:
+        try:
+            if asyncio.iscoroutinefunction(section.run):
+                return await section.run(results)
+            # Las funciones síncronas (p. ej. gpt bloqueante) se ejecutan en un hilo
+            return await asyncio.to_thread(section.run, results)
+        except SectionError:
+            raise
+        except Exception as e:
+            raise SectionError(section.name, e) from e
+
+
+async def run_sections(
+    sections: List[Section],
+    context: Optional[Dict[str, object]] = None,
+    max_parallel: Optional[int] = None,
+    on_section_done: Optional[Callable[[str, object], Optional[Awaitable[None]]]] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> Dict[str, object]:
+    """
+    Ejecuta el grafo de secciones: cada sección arranca en cuanto sus dependencias terminan,
+    con un máximo de `max_parallel` secciones en vuelo. Devuelve el contexto más los resultados.
+    Si se pasa `semaphore`, ese límite se comparte con otros grafos (p. ej. en un lote).
+    Si una sección falla, se cancelan las pendientes y se propaga el error.
+    """
+    results: Dict[str, object] = dict(context or {})
+    _validate(sections, results.keys())
+
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(1, max_parallel or MAX_PARALLEL_SECTIONS))
+    pending = {s.name: s for s in sections}
+    running: Dict[asyncio.Task, str] = {}
+
+    def launch_ready():
+        for name, section in list(pending.items()):
+            if all(d in results for d in section.depends_on):
+                del pending[name]
+                task = asyncio.ensure_future(_run_one(section, results, semaphore))
+                running[task] = name
+
+    launch_ready()
+    try:
+        while running:
+            done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = running.pop(task)
+                results[name] = task.result()
+                if on_section_done is not None:
+                    callback = on_section_done(name, results[name])
+                    if asyncio.iscoroutine(callback):
+                        await callback
+            launch_ready()
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running.keys(), return_exceptions=True)
+
+    return results
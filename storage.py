@@ -0,0 +1,43 @@
+# storage.py
+#
+# Piezas comunes de los almacenes en SQLite (caché del LLM, artículos y artefactos):
+# conexión compartida entre hilos en modo WAL y apertura perezosa de la instancia global.
+
+import sqlite3
+import threading
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class SQLiteDatabase:
+    """
+    Conexión SQLite en modo WAL, para que varios workers de uvicorn compartan el archivo,
+    con un lock que serializa su uso entre hilos. `schema` son las sentencias CREATE a ejecutar.
+    """
+
+    def __init__(self, path: str, *schema: str):
+        self.db_path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            for statement in schema:
+                self.conn.execute(statement)
+            self.conn.commit()
+
+
+def lazy_singleton(factory: Callable[[], T]) -> Callable[[], T]:
+    # Devuelve un getter que crea la instancia en el primer uso, para no tocar disco al importar
+    instance = None
+    lock = threading.Lock()
+
+    def get() -> T:
+        nonlocal instance
+        if instance is None:
+            with lock:
+                if instance is None:
+                    instance = factory()
+        return instance
+
+    return get
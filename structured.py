@@ -0,0 +1,112 @@
+# structured.py
+#
+# Generación estructurada: las secciones de varios párrafos se piden como JSON con campos
+# nombrados, se validan contra un esquema y solo los campos faltantes se vuelven a pedir.
+
+import asyncio
+import json
+import re
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from prompts import budget_for_words
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+# Pares "clave": "valor" completos, para rescatar campos de un JSON cortado por max_tokens
+_PAIR_RE = re.compile(r'"(\w+)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+class Field:
+    # Campo del esquema: descripción para el modelo y longitud objetivo en palabras
+    def __init__(self, description: str, words: int, required: bool = True):
+        self.description = description
+        self.words = words
+        self.required = required
+
+    @property
+    def min_words(self) -> int:
+        # Por debajo del 40 % de la longitud pedida se considera incompleto
+        return int(self.words * 0.4) if self.required else 0
+
+
+def token_budget(fields: Dict[str, Field]) -> int:
+    # Texto de cada campo más las claves, comillas y escapes del JSON
+    return sum(budget_for_words(f.words) + 20 for f in fields.values())
+
+
+def json_instructions(fields: Dict[str, Field]) -> str:
+    keys = ", ".join(f'"{k}" ({f.description})' for k, f in fields.items())
+    return (
+        f"\n\nDevuelve únicamente un objeto JSON válido, sin texto adicional ni bloques de código, "
+        f"con estas claves: {keys}. Cada valor es un solo párrafo en texto plano."
+    )
+
+
+def _salvage_pairs(texto: str) -> Dict[str, object]:
+    data = {}
+    for key, raw in _PAIR_RE.findall(texto):
+        try:
+            data[key] = json.loads(f'"{raw}"')
+        except json.JSONDecodeError:
+            continue
+    return data
+
+
+def parse_json_object(texto: str) -> Dict[str, object]:
+    """
+    Extrae el objeto JSON de la respuesta. Si está incompleto o mal formado, rescata los
+    pares clave/valor que sí llegaron completos; {} si no hay nada aprovechable.
+    """
+    texto = _FENCE_RE.sub("", texto.strip())
+    start, end = texto.find("{"), texto.rfind("}")
+    if start != -1 and end > start:
+        try:
+            data = json.loads(texto[start:end + 1])
+            if isinstance(data, dict):
+                return data
+        except json.JSONDecodeError:
+            pass
+    return _salvage_pairs(texto[start:] if start != -1 else texto)
+
+
+def validate(data: Dict[str, object], fields: Dict[str, Field]) -> Tuple[Dict[str, str], List[str]]:
+    """Devuelve (campos válidos, campos a reparar) según el esquema."""
+    valid, missing = {}, []
+    for key, field in fields.items():
+        value = data.get(key)
+        if isinstance(value, str) and len(value.split()) >= field.min_words:
+            valid[key] = value.strip()
+        elif field.required:
+            missing.append(key)
+        else:
+            valid[key] = value.strip() if isinstance(value, str) else ""
+    return valid, missing
+
+
+async def repair_field(ask: Callable[..., Awaitable[str]], prompt: str, key: str, field: Field) -> str:
+    """Pide un único campo del encargo `prompt` en una llamada dirigida."""
+    repair_prompt = (
+        f"{prompt}\n\nDe ese encargo, redacta SOLO el párrafo \"{key}\" ({field.description}), "
+        f"de unas {field.words} palabras." + json_instructions({key: field})
+    )
+    value = parse_json_object(await ask(repair_prompt, token_budget({key: field}))).get(key)
+    if not isinstance(value, str) or len(value.split()) < max(1, field.min_words):
+        raise ValueError(f"No se pudo generar el campo '{key}' con el formato esperado")
+    return value.strip()
+
+
+async def generate_structured(ask: Callable[..., Awaitable[str]], prompt: str,
+                              fields: Dict[str, Field]) -> Dict[str, str]:
+    """
+    Pide la sección como JSON y repara en paralelo solo los campos ausentes o demasiado cortos,
+    con una llamada dirigida por campo.
+    """
+    # Una respuesta cortada en max_tokens sirve igual: se rescatan los pares completos y solo se
+    # reparan los campos que faltan, en vez de volver a pedir todo el grupo
+    response = await ask(prompt + json_instructions(fields), token_budget(fields), allow_truncated=True)
+    valid, missing = validate(parse_json_object(response), fields)
+    if not missing:
+        return valid
+
+    repaired = await asyncio.gather(*(repair_field(ask, prompt, k, fields[k]) for k in missing))
+    valid.update(zip(missing, repaired))
+    return {key: valid[key] for key in fields}